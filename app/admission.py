@@ -0,0 +1,88 @@
+"""
+Admission control for the endpoints that query the database.
+
+Each endpoint (keyed by its route name, e.g. "top_products") may run at most
+ADMISSION_CONCURRENCY database-bound requests at once, or the limit given for it in
+ADMISSION_LIMITS ("batch_reports=2,timeseries=4"). A request over the limit waits up to
+ADMISSION_WAIT_SECONDS for a slot, then is rejected with 503 and Retry-After. Handlers
+answer cached responses before asking for a slot, so those keep flowing under overload.
+
+Outcomes are counted per endpoint and served by /metrics:
+- admitted: got a slot, queued: had to wait for it first, rejected: gave up waiting
+- pool_timeouts: no pooled connection within POOL_TIMEOUT_SECONDS, or the pool's
+  waiting queue was full
+- statement_timeouts: a query ran past STATEMENT_TIMEOUT_MS and was cancelled
+"""
+
+import os
+import asyncio
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", 8))
+ADMISSION_LIMITS = {
+    name.strip(): int(limit)
+    for name, limit in (item.split("=") for item in os.getenv("ADMISSION_LIMITS", "").split(",") if item.strip())
+}
+ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", 2))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", 1))
+
+OUTCOMES = ("admitted", "queued", "rejected", "pool_timeouts", "statement_timeouts")
+
+# endpoint -> outcome counts, and endpoint -> requests holding a slot right now
+stats = defaultdict(Counter)
+running = Counter()
+
+_semaphores = {}
+
+class Overloaded(Exception):
+    """No slot freed up for the endpoint within ADMISSION_WAIT_SECONDS."""
+
+def semaphore(endpoint: str) -> asyncio.Semaphore:
+    if endpoint not in _semaphores:
+        _semaphores[endpoint] = asyncio.Semaphore(ADMISSION_LIMITS.get(endpoint, ADMISSION_CONCURRENCY))
+    return _semaphores[endpoint]
+
+@asynccontextmanager
+async def admit(endpoint: str):
+    """Hold one of the endpoint's slots, waiting a bounded time for it."""
+    slots = semaphore(endpoint)
+    if slots.locked():
+        stats[endpoint]["queued"] += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), ADMISSION_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            stats[endpoint]["rejected"] += 1
+            raise Overloaded(endpoint)
+    else:
+        await slots.acquire()
+    stats[endpoint]["admitted"] += 1
+    running[endpoint] += 1
+    try:
+        yield
+    finally:
+        running[endpoint] -= 1
+        slots.release()
+
+def count(endpoint: str, outcome: str):
+    stats[endpoint][outcome] += 1
+
+def metric_lines() -> list:
+    """Prometheus lines for the outcome counters and the requests in flight."""
+    lines = [
+        "# HELP admission_requests_total Database-bound requests per endpoint and outcome.",
+        "# TYPE admission_requests_total counter",
+    ]
+    for endpoint, counts in stats.items():
+        for outcome in OUTCOMES:
+            lines.append(f'admission_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {counts[outcome]}')
+    lines += [
+        "# HELP admission_in_flight Requests holding an admission slot.",
+        "# TYPE admission_in_flight gauge",
+    ]
+    for endpoint, value in running.items():
+        lines.append(f'admission_in_flight{{endpoint="{endpoint}"}} {value}')
+    return lines
@@ -0,0 +1,69 @@
+"""
+accuracy=approx: reports over raw sales computed from a Bernoulli row sample.
+
+The sample rate is picked so that about APPROX_SAMPLE_ROWS rows are expected to match,
+using the planner's per-partition row estimates and the share of rows a sku or region
+filter keeps. When that rate would exceed APPROX_MAX_PERCENT, sampling saves too little
+and the exact report is returned instead.
+
+Sampled sums are scaled by 1/f (f = percent / 100). Each row is in the sample
+independently with probability f, so the scaled sum is unbiased and its variance is
+estimated by (1 - f) / f^2 * sum(y^2). Intervals are estimate +- Z * sqrt(variance), and
+never go below the sampled sum, since every row counted in it is part of the true total.
+"""
+
+import os
+import math
+from datetime import date, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APPROX_SAMPLE_ROWS = int(os.getenv("APPROX_SAMPLE_ROWS", 100000))
+APPROX_MAX_PERCENT = float(os.getenv("APPROX_MAX_PERCENT", 25))
+
+# Two-sided 95% normal quantile
+Z = 1.96
+
+# Fixed seed for REPEATABLE, the same request reads the same sample
+SEED = 42
+
+def next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+def estimated_rows(partitions: list, start: date, end: date) -> float:
+    """Rows estimated in [start, end), prorating partitions the range only partly covers."""
+    total = 0.0
+    for partition in partitions:
+        month, rows = partition["month"], partition["estimated_rows"]
+        month_end = next_month(month)
+        covered = (min(end, month_end) - max(start, month)).days
+        if covered > 0:
+            total += rows * covered / (month_end - month).days
+    return total
+
+def sample_percent(matching_rows: float):
+    """Percent of rows to sample, or None when the exact report is the better deal."""
+    if matching_rows <= 0:
+        return None
+    percent = 100 * APPROX_SAMPLE_ROWS / matching_rows
+    if percent > APPROX_MAX_PERCENT:
+        return None
+    # TABLESAMPLE takes a real, keep it readable in responses and cache keys
+    return float(f"{percent:.3g}")
+
+def scale_rows(rows: list, percent: float) -> list:
+    """Scale sampled sums to estimates of the full totals, with 95% intervals."""
+    fraction = percent / 100
+    factor = (1 - fraction) / fraction ** 2
+    scaled = []
+    for row in rows:
+        out = {k: v for k, v in row.items() if k not in ("total_revenue_sq", "total_quantity_sq")}
+        for column in ("total_revenue", "total_quantity"):
+            sampled = row[column]
+            estimate = sampled / fraction
+            half_width = Z * math.sqrt(factor * row[f"{column}_sq"])
+            out[column] = round(estimate)
+            out[f"{column}_ci"] = [round(max(sampled, estimate - half_width)), round(estimate + half_width)]
+        scaled.append(out)
+    return scaled
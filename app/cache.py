@@ -1,25 +1,325 @@
 import os
-from cachetools import TTLCache, cached
+import sys
+import zlib
+import heapq
+import pickle
+import asyncio
+from datetime import date, timedelta
+from time import monotonic
+from functools import wraps
+from cachetools import Cache, TTLCache, LRUCache
 from dotenv import load_dotenv
+from app.metrics import note_cache
+from app import data_version, shared_cache
 
 load_dotenv()
 
 CACHE_TTL = int(os.getenv("CACHE_TTL_SECONDS", 300))
+# Turns every lookup into a miss, used to benchmark the uncached path
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# How long an expired entry may still be served while one background refresh runs,
+# 0 disables stale-while-revalidate
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", 0))
+# Memory budget of the three caches together, in bytes. Each cache evicts its least
+# recently used entries once its share is full
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Entries estimated at this many bytes or more are stored zlib-compressed, 0 disables
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 64 * 1024))
 
-report_cache = TTLCache(maxsize=128, ttl=CACHE_TTL)
+class Compressed:
+    """A cached value kept as zlib-compressed bytes, or a compressed pickle of rows."""
+    __slots__ = ("data", "pickled")
+
+    def __init__(self, value):
+        self.pickled = not isinstance(value, bytes)
+        # Level 1: report rows and JSON shrink ~5x already, higher levels mostly cost time
+        self.data = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if self.pickled else value, 1)
+
+    def value(self):
+        data = zlib.decompress(self.data)
+        return pickle.loads(data) if self.pickled else data
+
+def sizeof(value) -> int:
+    """
+    Bytes held by a cached value, getsizeof of every container and item it reaches.
+    Dict keys are column names shared by all rows and are not counted.
+    """
+    if isinstance(value, Compressed):
+        return sys.getsizeof(value.data)
+    if isinstance(value, (list, tuple)):
+        if len(value) > 64:
+            # Rows of one result share a shape, size every n-th one and scale up
+            sample = value[::len(value) // 32]
+            return sys.getsizeof(value) + sum(sizeof(item) for item in sample) * len(value) // len(sample)
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+def pack(value):
+    if CACHE_COMPRESS_MIN_BYTES and sizeof(value) >= CACHE_COMPRESS_MIN_BYTES:
+        return Compressed(value)
+    return value
+
+def unpack(value):
+    return value.value() if isinstance(value, Compressed) else value
+
+# Entries are (result, stored_at) tuples, kept past CACHE_TTL for the stale window
+report_cache = TTLCache(maxsize=CACHE_MAX_BYTES // 2, ttl=CACHE_TTL + CACHE_STALE_SECONDS, getsizeof=sizeof)
+
+# Monthly-sales cells keyed by (month, sku, region) holding the month's row, or None
+# for a month without sales. Entries are (row, expires_at), closed months never
+# expire and are only dropped when ingest invalidates them
+month_cache = LRUCache(maxsize=CACHE_MAX_BYTES // 8, getsizeof=sizeof)
+
+# Encoded JSON bodies keyed by (report, params). A hit is returned as-is, skipping
+# row models, response_model validation and serialization
+response_cache = TTLCache(maxsize=CACHE_MAX_BYTES * 3 // 8, ttl=CACHE_TTL, getsizeof=sizeof)
+
+def store(cache, key, value):
+    # cachetools refuses a single value larger than the whole cache, leave it uncached
+    try:
+        cache[key] = value
+    except ValueError:
+        pass
+
+cache_stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0, "response_hits": 0, "shared_hits": 0}
+
+# Keys currently being computed, so concurrent misses share one query
+_inflight = {}
+
+def single_flight(key, load):
+    """Return the task computing key, starting load() only if nobody else is already."""
+    task = _inflight.get(key)
+    if task is not None:
+        cache_stats["coalesced"] += 1
+        return task
+    
+    async def run():
+        try:
+            return await load()
+        finally:
+            _inflight.pop(key, None)
+    
+    task = asyncio.create_task(run())
+    _inflight[key] = task
+    return task
+
+def _consume_error(task):
+    # Background refreshes have nobody awaiting them, the stale entry stays until it expires
+    if not task.cancelled():
+        task.exception()
+
+def report_key(sql: str, params: dict):
+    # Create a hashable key from the SQL and sorted params
+    return (sql, tuple(sorted(params.items())))
+
+async def lookup_report(key):
+    """
+    The (result, stored_at) entry of key in this worker's report cache. With a shared
+    backend, a local miss is looked up there and a hit copied into the local cache.
+    """
+    entry = report_cache.get(key)
+    # A key already being computed here is about to be cached locally, no need to look
+    if entry is None and key not in _inflight and shared_cache.enabled and data_version.current is not None:
+        shared = await shared_cache.get(key, data_version.current)
+        # Entries past the stale window may linger there until the next purge
+        if shared is not None and shared[1] < CACHE_TTL + CACHE_STALE_SECONDS:
+            result, age = shared
+            cache_stats["shared_hits"] += 1
+            entry = (pack(result), monotonic() - age)
+            store(report_cache, key, entry)
+    return entry
+
+async def get_report(key):
+    """Return the fresh cached result for key, or None."""
+    entry = await lookup_report(key) if CACHE_ENABLED else None
+    if entry is not None and monotonic() - entry[1] < CACHE_TTL:
+        cache_stats["hits"] += 1
+        note_cache("hit")
+        return unpack(entry[0])
+    note_cache("miss")
+    cache_stats["misses"] += 1
+    return None
+
+def put_report(key, result, version=None):
+    """Cache result locally, and in the shared backend under the data version it was read at."""
+    store(report_cache, key, (pack(result), monotonic()))
+    version = version if version is not None else data_version.current
+    if shared_cache.enabled and version is not None:
+        params = dict(key[1])
+        shared_cache.put(
+            key, version, result, compress_min_bytes=CACHE_COMPRESS_MIN_BYTES,
+            max_age=CACHE_TTL + CACHE_STALE_SECONDS, start=params.get("start"), end=params.get("end")
+        )
 
 def cached_report(func):
     def cache_key(*args, **kwargs):
         # Extract sql and params from kwargs to create a unique cache key
-        sql = kwargs.get("sql")
-        params = kwargs.get("params", {})
-        # Create a hashable key from the SQL and sorted params
-        return (sql, tuple(sorted(params.items())))
-    
-    return cached(
-        cache=report_cache,
-        key=cache_key
-    )(func)
-
-# def clear_cache():
-#     report_cache.clear()
+        return report_key(kwargs.get("sql"), kwargs.get("params", {}))
+    
+    # cachetools.cached would store the coroutine object instead of its result,
+    # so await the wrapped function and cache what it returns
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not CACHE_ENABLED:
+            return await func(*args, **kwargs)
+        key = cache_key(*args, **kwargs)
+        
+        async def load():
+            # Read before querying: if an ingest lands meanwhile, the result is filed under the old version
+            version = data_version.current
+            result = await func(*args, **kwargs)
+            put_report(key, result, version)
+            return result
+        
+        entry = await lookup_report(key)
+        if entry is not None:
+            result, stored_at = entry
+            if monotonic() - stored_at < CACHE_TTL:
+                cache_stats["hits"] += 1
+                return unpack(result)
+            cache_stats["stale"] += 1
+            if key not in _inflight:
+                single_flight(key, load).add_done_callback(_consume_error)
+            return unpack(result)
+        
+        if key not in _inflight:
+            cache_stats["misses"] += 1
+        # Shield so a disconnecting client does not cancel the query other callers wait on
+        return await asyncio.shield(single_flight(key, load))
+    
+    return wrapper
+
+def get_response(key):
+    body = response_cache.get(key) if CACHE_ENABLED else None
+    if body is not None:
+        cache_stats["response_hits"] += 1
+    note_cache("miss" if body is None else "hit")
+    return unpack(body)
+
+def put_response(key, body: bytes):
+    store(response_cache, key, pack(body))
+
+def get_month_cells(months, sku: str, region: str) -> dict:
+    """Return {month: row or None} for the months that have a live cached cell."""
+    now = monotonic()
+    cells = {}
+    for month in months if CACHE_ENABLED else ():
+        entry = month_cache.get((month, sku, region))
+        if entry is not None and (entry[1] is None or entry[1] > now):
+            cells[month] = entry[0]
+    hits = len(cells)
+    cache_stats["hits"] += hits
+    cache_stats["misses"] += len(months) - hits
+    return cells
+
+def set_month_cell(month: date, sku: str, region: str, row):
+    # The current (and any future) month still receives sales, so it expires like other reports
+    closed = month < date.today().replace(day=1)
+    store(month_cache, (month, sku, region), (row, None if closed else monotonic() + CACHE_TTL))
+
+def get_cache_stats():
+    lookups = cache_stats["hits"] + cache_stats["stale"] + cache_stats["misses"] + cache_stats["coalesced"]
+    return {
+        **cache_stats,
+        "hit_ratio": (cache_stats["hits"] + cache_stats["stale"]) / lookups if lookups else 0.0,
+        "size": len(report_cache),
+        "month_cells": len(month_cache),
+        "responses": len(response_cache),
+        "inflight": len(_inflight),
+        "bytes": {name: cache.currsize for name, cache in caches().items()},
+        "max_bytes": {name: cache.maxsize for name, cache in caches().items()},
+    }
+
+def caches() -> dict:
+    return {"report": report_cache, "month": month_cache, "response": response_cache}
+
+def top_keys(limit: int = 20) -> list:
+    """The largest entries across the caches, as (cache name, key, bytes)."""
+    sizes = [(name, key, size) for name, cache in caches().items() for key, size in entry_sizes(cache).items()]
+    return heapq.nlargest(limit, sizes, key=lambda item: item[2])
+
+def entry_sizes(cache) -> dict:
+    """
+    key -> bytes of every entry, as cachetools accounted them on insert. Reading them
+    neither re-walks the values nor touches LRU order, which cache.get() would.
+    """
+    # cachetools keeps the sizes in a name-mangled dict, the version is pinned in requirements.txt
+    sizes = getattr(cache, "_Cache__size", None)
+    if isinstance(sizes, dict):
+        return dict(sizes)
+    # Without it, measure the values again. Cache.__getitem__ skips the subclasses' LRU update
+    return {key: cache.getsizeof(Cache.__getitem__(cache, key)) for key in list(cache)}
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def _overlaps(start, end, months: list) -> bool:
+    # [start, end) overlaps month m when start < next month and end > m
+    try:
+        start, end = _as_date(start), _as_date(end)
+    except (TypeError, ValueError):
+        return True
+    return any(start < (m + timedelta(days=32)).replace(day=1) and end > m for m in months)
+
+def invalidate_months(months: list) -> int:
+    """
+    Drop cached entries that cover any of the given month starts, after an append ingest
+    touched only those months. Returns how many entries were dropped.
+    """
+    months = [_as_date(m) for m in months]
+    month_set = set(months)
+    stale = [key for key in month_cache if key[0] in month_set]
+    for key in stale:
+        month_cache.pop(key, None)
+    dropped = len(stale)
+    
+    # Report keys are (sql, sorted params) with start/end params
+    for key in list(report_cache.keys()):
+        params = dict(key[1])
+        if _overlaps(params.get("start"), params.get("end"), months):
+            report_cache.pop(key, None)
+            dropped += 1
+    
+    # Response keys are (report, start_date, end_date, ...)
+    for key in list(response_cache.keys()):
+        if _overlaps(key[1], key[2], months):
+            response_cache.pop(key, None)
+            dropped += 1
+    return dropped
+
+def invalidate(report: str = None, start=None, end=None) -> int:
+    """
+    Drop cached entries of one report and/or overlapping [start, end), either bound may be
+    left open. Report-cache rows are not tagged with their report, so every one overlapping
+    the range goes whichever report is named. Returns how many entries were dropped.
+    """
+    low = _as_date(start) if start else date.min
+    high = _as_date(end) if end else date.max
+    
+    def overlaps(entry_start, entry_end) -> bool:
+        try:
+            return _as_date(entry_start) < high and _as_date(entry_end) > low
+        except (TypeError, ValueError):
+            return True
+    
+    stale = []
+    if report in (None, "monthly-sales"):
+        stale += [(month_cache, key) for key in month_cache
+                  if overlaps(key[0], (key[0] + timedelta(days=32)).replace(day=1))]
+    for key in report_cache.keys():
+        params = dict(key[1])
+        if overlaps(params.get("start"), params.get("end")):
+            stale.append((report_cache, key))
+    for key in response_cache.keys():
+        if (report is None or key[0] == report) and overlaps(key[1], key[2]):
+            stale.append((response_cache, key))
+    for cache, key in stale:
+        cache.pop(key, None)
+    return len(stale)
+
+def clear_cache():
+    report_cache.clear()
+    month_cache.clear()
+    response_cache.clear()
@@ -0,0 +1,182 @@
+import os
+import logging
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from psycopg.errors import UndefinedTable
+from app.dimensions import Dimensions
+
+try:
+    import numpy as np
+except ImportError:  # only needed when REPORT_ENGINE=numpy
+    np = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "sql" answers reports from Postgres, "numpy" from the in-process SalesColumns below
+REPORT_ENGINE = os.getenv("REPORT_ENGINE", "sql")
+
+EPOCH = date(1970, 1, 1)
+
+# Binary COPY is parsed straight into arrays, every field is fixed width and NOT NULL,
+# so each tuple is: field count, then (length, value) per column, all big-endian
+SALES_COPY = """
+COPY (
+    SELECT sale_date - DATE '1970-01-01', product_id, region_id, quantity, quantity * unit_price
+    FROM sales
+) TO STDOUT (FORMAT binary)
+"""
+COPY_HEADER_BYTES = 19
+COPY_PARSE_BYTES = 64 * 1024 * 1024
+
+if np is not None:
+    COPY_ROW = np.dtype([
+        ("nfields", ">i2"),
+        ("day_len", ">i4"), ("day", ">i4"),
+        ("product_len", ">i4"), ("product_id", ">i4"),
+        ("region_len", ">i4"), ("region_id", ">i4"),
+        ("quantity_len", ">i4"), ("quantity", ">i8"),
+        ("revenue_len", ">i4"), ("revenue", ">i8"),
+    ])
+
+def _to_day(value: str) -> int:
+    return (date.fromisoformat(value) - EPOCH).days
+
+def _next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+class SalesColumns:
+    """
+    The sales fact held as NumPy arrays sorted by sale date, about 28 bytes per row.
+    Date ranges become a binary search plus a slice, group-bys are np.add.reduceat over
+    month boundaries or np.bincount over product ids.
+    """
+
+    def __init__(self, day, product_id, region_id, quantity, revenue, dims: Dimensions):
+        order = np.argsort(day, kind="stable")
+        self.day = day[order]
+        self.product_id = product_id[order]
+        self.region_id = region_id[order]
+        self.quantity = quantity[order]
+        self.revenue = revenue[order]
+        # Snapshot of products/regions taken together with the arrays
+        self.dims = dims
+
+    def __len__(self):
+        return len(self.day)
+
+    @classmethod
+    async def from_db(cls, conn) -> "SalesColumns":
+        chunks = []
+        buf = bytearray()
+        header_seen = False
+        async with conn.cursor() as cursor:
+            async with cursor.copy(SALES_COPY) as copy:
+                async for data in copy:
+                    buf += data
+                    if not header_seen and len(buf) >= COPY_HEADER_BYTES:
+                        del buf[:COPY_HEADER_BYTES]
+                        header_seen = True
+                    if header_seen and len(buf) >= COPY_PARSE_BYTES:
+                        chunks.append(cls._parse(buf))
+            chunks.append(cls._parse(buf))
+        dims = await Dimensions.from_db(conn)
+
+        columns = [np.concatenate([chunk[i] for chunk in chunks]) for i in range(5)]
+        return cls(*columns, dims)
+
+    @staticmethod
+    def _parse(buf: bytearray):
+        # Whole tuples only, a partial one (or the 2 byte trailer) stays in buf
+        size = (len(buf) // COPY_ROW.itemsize) * COPY_ROW.itemsize
+        rows = np.frombuffer(bytes(buf[:size]), dtype=COPY_ROW)
+        del buf[:size]
+        return (
+            rows["day"].astype(np.int32),
+            rows["product_id"].astype(np.int32),
+            rows["region_id"].astype(np.int32),
+            rows["quantity"].astype(np.int64),
+            rows["revenue"].astype(np.int64),
+        )
+
+    def _select(self, start: str, end: str, product_id=None, region_id=None):
+        lo, hi = np.searchsorted(self.day, [_to_day(start), _to_day(end)])
+        day = self.day[lo:hi]
+        product = self.product_id[lo:hi]
+        quantity = self.quantity[lo:hi]
+        revenue = self.revenue[lo:hi]
+        mask = None
+        if product_id is not None:
+            mask = product == product_id
+        if region_id is not None:
+            region_mask = self.region_id[lo:hi] == region_id
+            mask = region_mask if mask is None else mask & region_mask
+        if mask is not None:
+            day, product, quantity, revenue = day[mask], product[mask], quantity[mask], revenue[mask]
+        return day, product, quantity, revenue
+
+    def monthly_sales(self, start: str, end: str, sku: str = "", region: str = "") -> list:
+        ids = self.dims.resolve(sku, region)
+        if ids is None:
+            return []
+        day, _, quantity, revenue = self._select(start, end, ids["product_id"], ids["region_id"])
+        if not len(day):
+            return []
+
+        # Rows are sorted by day, so each month is a contiguous run starting at its first day
+        first = date.fromisoformat(start)
+        months = [first.replace(day=1)]
+        while (nxt := _next_month(months[-1])) < date.fromisoformat(end):
+            months.append(nxt)
+        bounds = np.searchsorted(day, [(m - EPOCH).days for m in months])
+        counts = np.diff(np.append(bounds, len(day)))
+        nonempty = counts > 0
+        starts = bounds[nonempty]
+        revenue_totals = np.add.reduceat(revenue, starts)
+        quantity_totals = np.add.reduceat(quantity, starts)
+        labels = [m.strftime("%Y-%m") for m, keep in zip(months, nonempty) if keep]
+        return [
+            {"month": label, "total_revenue": int(rev), "total_quantity": int(qty)}
+            for label, rev, qty in zip(labels, revenue_totals, quantity_totals)
+        ]
+
+    def top_products(self, start: str, end: str, region: str = "", limit: int = 5) -> list:
+        ids = self.dims.resolve(region=region)
+        if ids is None:
+            return []
+        _, product, quantity, revenue = self._select(start, end, region_id=ids["region_id"])
+        if not len(product):
+            return []
+
+        # bincount sums in float64, exact for totals below 2**53
+        revenue_totals = np.bincount(product, weights=revenue).round().astype(np.int64)
+        quantity_totals = np.bincount(product, weights=quantity).round().astype(np.int64)
+        sold = np.flatnonzero(np.bincount(product))
+        if len(sold) > limit:
+            sold = sold[np.argpartition(-revenue_totals[sold], limit - 1)[:limit]]
+        top = sold[np.argsort(-revenue_totals[sold], kind="stable")]
+        return self.dims.decorate_products([
+            {
+                "product_id": pid,
+                "total_revenue": int(revenue_totals[pid]),
+                "total_quantity": int(quantity_totals[pid]),
+            }
+            for pid in top.tolist()
+        ])
+
+# Set by reload() when REPORT_ENGINE=numpy, replaced wholesale so readers never see a partial load
+engine = None
+
+async def reload(pool):
+    global engine
+    if np is None:
+        raise RuntimeError("REPORT_ENGINE=numpy requires numpy, install it with `pip install numpy`")
+    try:
+        async with pool.connection() as conn:
+            engine = await SalesColumns.from_db(conn)
+    except UndefinedTable:
+        # Reports go through SQL until the first ingest's NOTIFY reloads the columns
+        logger.warning("sales table missing, numpy engine not loaded")
+        engine = None
+    return engine
@@ -0,0 +1,29 @@
+"""
+The data version bumped by every ingest (migration 005_data_version.sql). Report ETags
+are derived from it, so a client revalidating after an ingest gets the new body.
+"""
+
+import logging
+from psycopg.errors import UndefinedTable
+
+logger = logging.getLogger(__name__)
+
+# None while unknown (no ingest recorded, or a reload after ingest is in progress),
+# responses then carry no ETag so nothing stale can be revalidated
+current = None
+
+async def reload(pool):
+    global current
+    try:
+        async with pool.connection() as conn:
+            row = await (await conn.execute("SELECT version FROM data_version")).fetchone()
+    except UndefinedTable:
+        # Migration 005 is applied by the first ingest
+        logger.warning("data_version table missing, serving reports without ETags")
+        row = None
+    current = row[0] if row else None
+    return current
+
+def invalidate():
+    global current
+    current = None
@@ -1,17 +1,41 @@
 import os
-from psycopg_pool import ConnectionPool
+from contextlib import asynccontextmanager
+from time import perf_counter
+from psycopg_pool import AsyncConnectionPool
 from dotenv import load_dotenv
+from app.metrics import record_phase
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-pool = ConnectionPool(
+
+# How long a request may wait for a pooled connection, and how many may wait at once,
+# before psycopg_pool raises PoolTimeout / TooManyRequests (answered with 503)
+POOL_TIMEOUT_SECONDS = float(os.getenv("POOL_TIMEOUT_SECONDS", 5))
+POOL_MAX_WAITING = int(os.getenv("POOL_MAX_WAITING", 50))
+# Queries running longer are cancelled so one bad report cannot hold a connection, 0 disables
+STATEMENT_TIMEOUT_MS = int(os.getenv("STATEMENT_TIMEOUT_MS", 30000))
+
+async def configure(conn):
+    # Connections are autocommit, the setting stays for the session
+    await conn.execute(f"SET statement_timeout = {STATEMENT_TIMEOUT_MS}")
+
+# Opened and closed by the FastAPI lifespan, an async pool needs a running event loop
+pool = AsyncConnectionPool(
     conninfo=DATABASE_URL,
     kwargs={"autocommit": True},
     min_size=1,
-    max_size=10
+    max_size=10,
+    timeout=POOL_TIMEOUT_SECONDS,
+    max_waiting=POOL_MAX_WAITING,
+    configure=configure,
+    open=False
 )
 
-def get_conn():
-    return pool.connection()
-
+@asynccontextmanager
+async def get_conn():
+    # Time spent waiting for a free connection shows up as the "pool" phase
+    started = perf_counter()
+    async with pool.connection() as conn:
+        record_phase("pool", perf_counter() - started)
+        yield conn
@@ -0,0 +1,92 @@
+import logging
+from psycopg.errors import UndefinedTable
+
+logger = logging.getLogger(__name__)
+
+class Dimensions:
+    """
+    Products and regions held in memory. With ~1000 products and a handful of regions
+    this is a few dictionaries, which lets reports filter sales on product_id/region_id
+    without joining and decorate top-product rows in Python.
+    """
+
+    def __init__(self, products: dict, regions: dict):
+        # id -> (sku, name) and id -> (code, name)
+        self.products = products
+        self.regions = regions
+        self.product_ids = {sku: pid for pid, (sku, _) in products.items()}
+        self.region_ids = {code: rid for rid, (code, _) in regions.items()}
+
+    @classmethod
+    async def from_db(cls, conn) -> "Dimensions":
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT id, sku, name FROM products")
+            products = {pid: (sku, name) for pid, sku, name in await cursor.fetchall()}
+            await cursor.execute("SELECT id, code, name FROM regions")
+            regions = {rid: (code, name) for rid, code, name in await cursor.fetchall()}
+        return cls(products, regions)
+
+    def resolve(self, sku: str = "", region: str = ""):
+        """
+        Map optional sku/region codes to {"product_id", "region_id"} query params.
+        Returns None when a code is unknown, the report is then empty without asking the database.
+        """
+        ids = {"product_id": None, "region_id": None}
+        if sku:
+            if sku not in self.product_ids:
+                return None
+            ids["product_id"] = self.product_ids[sku]
+        if region:
+            if region not in self.region_ids:
+                return None
+            ids["region_id"] = self.region_ids[region]
+        return ids
+
+    def decorate_products(self, rows: list) -> list:
+        """Swap product_id for product_sku/product_name on top-product rows."""
+        decorated = []
+        for row in rows:
+            sku, name = self.products[row["product_id"]]
+            decorated.append({
+                "product_sku": sku,
+                "product_name": name,
+                "total_revenue": row["total_revenue"],
+                "total_quantity": row["total_quantity"],
+            })
+            # Approximate rows also carry their confidence intervals
+            if "total_revenue_ci" in row:
+                decorated[-1]["total_revenue_ci"] = row["total_revenue_ci"]
+                decorated[-1]["total_quantity_ci"] = row["total_quantity_ci"]
+        return decorated
+
+    def timeseries_columns(self, rows: list, group_by: str) -> dict:
+        """
+        Turn timeseries rows into one list per column, with codes in place of ids.
+        A NULL id is a total over that dimension and stays None.
+        """
+        columns = {"bucket": [row["bucket"] for row in rows]}
+        if group_by in ("region", "both"):
+            columns["region_code"] = [
+                self.regions[row["region_id"]][0] if row["region_id"] is not None else None for row in rows
+            ]
+        if group_by in ("product", "both"):
+            columns["product_sku"] = [
+                self.products[row["product_id"]][0] if row["product_id"] is not None else None for row in rows
+            ]
+        columns["total_revenue"] = [row["total_revenue"] for row in rows]
+        columns["total_quantity"] = [row["total_quantity"] for row in rows]
+        return columns
+
+# Current snapshot, loaded on startup and replaced wholesale after each ingest
+current = Dimensions({}, {})
+
+async def reload(pool) -> Dimensions:
+    global current
+    try:
+        async with pool.connection() as conn:
+            current = await Dimensions.from_db(conn)
+    except UndefinedTable:
+        # Nothing ingested yet, the ingest NOTIFY triggers the next reload
+        logger.warning("Dimension tables missing, starting with no products or regions")
+        current = Dimensions({}, {})
+    return current
@@ -0,0 +1,29 @@
+import asyncio
+import logging
+from psycopg import AsyncConnection
+from app.db import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# scripts/ingest_data.py sends NOTIFY on this channel once a load has committed
+INGEST_CHANNEL = "sales_ingested"
+RECONNECT_DELAY_SECONDS = 5
+
+async def listen_for_ingest(on_ingest):
+    """Call on_ingest(payload) for every ingest notification, reconnecting on failure."""
+    connected_before = False
+    while True:
+        try:
+            async with await AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {INGEST_CHANNEL}")
+                if connected_before:
+                    # Notifications sent while we were disconnected are lost
+                    on_ingest("")
+                connected_before = True
+                async for notify in conn.notifies():
+                    on_ingest(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ingest listener failed, reconnecting in %ss", RECONNECT_DELAY_SECONDS)
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
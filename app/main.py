@@ -1,55 +1,762 @@
-from fastapi import FastAPI, Query
-from app.cache import cached_report
-from app.models import MonthlySalesResponse, MonthRow, TopProductsResponse, TopProductRow
+import os
+import io
+import csv
+import json
+import heapq
+import asyncio
+import hmac
+import hashlib
+from contextlib import asynccontextmanager, nullcontext, suppress
+from fastapi import FastAPI, Query, Header, Request, Response, Depends, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from psycopg.errors import QueryCanceled
+from psycopg_pool import PoolTimeout, TooManyRequests
+from pydantic_core import to_json
+from app.cache import (
+    cached_report, get_cache_stats, clear_cache, invalidate, invalidate_months, get_month_cells, set_month_cell,
+    single_flight, report_key, get_report, put_report, get_response, put_response, top_keys
+)
+from app.db import pool, get_conn
+from app.metrics import TimingMiddleware, phase, render
+from app.events import listen_for_ingest
+from app.models import (
+    MonthlySalesResponse, MonthRow, TopProductsResponse, TopProductRow, BatchRequest, BatchResponse, ReportSpec,
+    TimeseriesResponse
+)
 from app.sql import reports
-from typing import Optional
+from app import admission, approx, columnar, dimensions, data_version, shared_cache, warmup
+from typing import Optional, Literal
+from datetime import date, timedelta
 
-app = FastAPI(title="Optimized Data Aggregation API")
+# Rows fetched from the server-side cursor per chunk of the export stream
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+
+# max-age for reports whose range ends before the current month, their data only
+# changes when an ingest rewrites history
+CLOSED_RANGE_MAX_AGE = int(os.getenv("CLOSED_RANGE_MAX_AGE_SECONDS", 86400))
+
+# Unaligned ranges over several months are split at partition boundaries, and the month
+# pieces run concurrently on up to FANOUT_WORKERS pool connections per request. All
+# fanned-out requests of the worker share FANOUT_CONNECTIONS, by default half the pool,
+# so admitted fan-outs cannot take every connection from the other reports
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 4))
+FANOUT_CONNECTIONS = int(os.getenv("FANOUT_CONNECTIONS", 0)) or max(1, pool.max_size // 2)
+_fanout_slots = asyncio.Semaphore(FANOUT_CONNECTIONS)
+
+# Upper bound on the rows a timeseries may return (buckets x breakdown keys, totals
+# included). Larger requests get 422 and must narrow the range or coarsen the buckets
+TIMESERIES_MAX_ROWS = int(os.getenv("TIMESERIES_MAX_ROWS", 200000))
+
+# The /admin endpoints require it in an X-Admin-Token header, and are disabled without it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Strong references to fire-and-forget tasks until they finish
+_background = set()
+
+async def refresh_after_ingest(months: list = None):
+    await dimensions.reload(pool)
+    if columnar.REPORT_ENGINE == "numpy":
+        await columnar.reload(pool)
+    # Reports cached while the old snapshots were current may have used stale ids or rows
+    if months:
+        invalidate_months(months)
+    else:
+        clear_cache()
+    # Only now hand out ETags again, bodies built from here on use the new data
+    await data_version.reload(pool)
+    await warm_caches()
+
+async def warm_caches():
+    await warmup.warm(warmup.warm_specs(dimensions.current.region_ids), warm_report)
+
+async def warm_report(spec: ReportSpec):
+    key = warmup.spec_key(spec)
+    if spec.report == "monthly-sales":
+        await monthly_sales_body(key, spec.start_date, spec.end_date, spec.product_sku or "", spec.region_code or "", {})
+    else:
+        await top_products_body(key, spec.start_date, spec.end_date, spec.region_code, spec.limit, {})
+
+def run_in_background(coro):
+    _background.add(task := asyncio.create_task(coro))
+    task.add_done_callback(_background.discard)
+
+def on_ingest(payload: str):
+    # An append names the months it touched, only reports overlapping them are dropped.
+    # A full ingest (or a listener reconnect) sends no months and drops everything
+    months = json.loads(payload).get("months") if payload else None
+    if months:
+        invalidate_months(months)
+    else:
+        clear_cache()
+    data_version.invalidate()
+    run_in_background(refresh_after_ingest(months))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pool.open()
+    await dimensions.reload(pool)
+    if columnar.REPORT_ENGINE == "numpy":
+        await columnar.reload(pool)
+    await data_version.reload(pool)
+    warmup.load_learned()
+    # Serve right away, /health?ready=true reports 503 until the first warm-up is done
+    run_in_background(warm_caches())
+    listener = asyncio.create_task(listen_for_ingest(on_ingest))
+    yield
+    listener.cancel()
+    for task in [listener, *_background]:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    warmup.save_learned()
+    await pool.close()
+
+app = FastAPI(title="Optimized Data Aggregation API", lifespan=lifespan)
+app.add_middleware(TimingMiddleware)
 
 @app.get("/health")
-def health_check():
-    return {"status": "ok"}
+async def health_check(
+    ready: bool = Query(False, description="Answer 503 until the report caches have been warmed once")
+):
+    if ready and not warmup.state["ready"]:
+        return JSONResponse({"status": "warming", "warmup": warmup.state}, status_code=503)
+    return {"status": "ok", "warmup": warmup.state}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return get_cache_stats()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled, set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def describe_key(cache: str, key: tuple):
+    if cache == "report":
+        sql, params = key
+        return {"sql": " ".join(sql.split()), "params": dict(params)}
+    return key
+
+@app.get("/admin/cache/keys", dependencies=[Depends(require_admin)])
+async def cache_keys(limit: int = Query(20, ge=1, le=500, description="Number of entries to list")):
+    """The largest cached entries, with how often recent requests asked for each response."""
+    return {"keys": [
+        {"cache": cache, "key": describe_key(cache, key), "bytes": size, "requests": warmup.requested.get(key, 0)}
+        for cache, key, size in top_keys(limit)
+    ]}
+
+@app.delete("/admin/cache", dependencies=[Depends(require_admin)])
+async def invalidate_cache(
+    report: Optional[Literal["monthly-sales", "top-products", "timeseries"]] = Query(None, description="Only this report"),
+    start_date: Optional[str] = Query(None, description="Only entries overlapping a range starting here (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Only entries overlapping a range ending here, exclusive (YYYY-MM-DD)")
+):
+    # Without any filter every entry overlaps, so everything is dropped
+    try:
+        dropped = invalidate(report, start_date, end_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates must be in YYYY-MM-DD format")
+    if shared_cache.enabled:
+        # Shared rows are not tagged by report either, so a report filter drops every overlapping one
+        dropped += await shared_cache.invalidate(start_date, end_date)
+    return {"dropped": dropped}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    stats = get_cache_stats()
+    gauges = {
+        "report_cache_size": ("Entries in the report cache.", stats["size"]),
+        "report_cache_hit_ratio": ("Fresh or stale hits over report cache lookups.", stats["hit_ratio"]),
+        "report_cache_response_hits": ("Requests answered from cached response bytes.", stats["response_hits"]),
+        "report_cache_shared_hits": ("Report cache misses answered by the shared cross-worker store.", stats["shared_hits"]),
+        "report_cache_shared_dropped_writes": ("Shared store writes dropped because its writer thread fell behind.", shared_cache.dropped_writes),
+        "month_cache_size": ("Monthly-sales cells in the month cache.", stats["month_cells"]),
+        "response_cache_size": ("Encoded responses in the response cache.", stats["responses"]),
+        **{
+            f"{name}_cache_bytes": (f"Estimated bytes held by the {name} cache.", size)
+            for name, size in stats["bytes"].items()
+        },
+    }
+    for name, value in pool.get_stats().items():
+        gauges[f"db_pool_{name}"] = (f"psycopg_pool {name}.", value)
+    return PlainTextResponse(render(gauges, admission.metric_lines()), media_type="text/plain; version=0.0.4")
+
+def endpoint_name(request: Request) -> str:
+    route = request.scope.get("route")
+    return route.name if route is not None else "unmatched"
+
+@app.exception_handler(admission.Overloaded)
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(TooManyRequests)
+async def overloaded(request: Request, exc: Exception):
+    # Admission rejections are counted when they happen, pool ones are counted here
+    if not isinstance(exc, admission.Overloaded):
+        admission.count(endpoint_name(request), "pool_timeouts")
+    return JSONResponse(
+        {"detail": "Server is busy, retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(admission.RETRY_AFTER_SECONDS)}
+    )
+
+@app.exception_handler(QueryCanceled)
+async def statement_timeout(request: Request, exc: QueryCanceled):
+    admission.count(endpoint_name(request), "statement_timeouts")
+    return JSONResponse({"detail": "Report query timed out"}, status_code=504)
+
+async def run_query(sql: str, params: dict = None):
+    async with get_conn() as conn:
+        async with conn.cursor() as cursor:
+            # Report SQL comes from a handful of builder variants, prepare them server side
+            with phase("sql"):
+                await cursor.execute(sql, params, prepare=True)
+                records = await cursor.fetchall()
+            with phase("build"):
+                cols = [d[0] for d in cursor.description]
+                return [dict(zip(cols, row)) for row in records]
+
+def json_response(key, payload: dict, headers: dict) -> Response:
+    # The payload already has the response_model's shape, encode it once and keep the bytes
+    with phase("serialize"):
+        body = to_json(payload)
+    put_response(key, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+def cached_response(key, headers: dict) -> Optional[Response]:
+    if (body := get_response(key)) is not None:
+        return Response(body, media_type="application/json", headers=headers)
+    return None
+
+def http_cache_headers(key, end_date: str) -> dict:
+    """ETag from (data version, report params) and a Cache-Control suited to the range."""
+    try:
+        closed = date.fromisoformat(end_date) <= date.today().replace(day=1)
+    except ValueError:
+        closed = False
+    # Open ranges may be stored, but must be revalidated on every use
+    headers = {"Cache-Control": f"public, max-age={CLOSED_RANGE_MAX_AGE}" if closed else "public, no-cache"}
+    if data_version.current is not None:
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        headers["ETag"] = f'"{data_version.current}-{digest}"'
+    return headers
+
+def etag_matches(if_none_match: Optional[str], headers: dict) -> bool:
+    etag = headers.get("ETag")
+    if not if_none_match or etag is None:
+        return False
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+def is_month_aligned(start_date: str, end_date: str) -> bool:
+    # Month-aligned ranges can be answered from the sales_monthly_agg rollup
+    try:
+        return date.fromisoformat(start_date).day == 1 and date.fromisoformat(end_date).day == 1
+    except ValueError:
+        return False
+
+def month_range(start: date, end: date) -> list:
+    months = []
+    month = start
+    while month < end:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+def missing_month_runs(months: list, cells: dict) -> list:
+    """Group the months without a cached cell into runs of consecutive months."""
+    runs = []
+    in_run = False
+    for month in months:
+        if month in cells:
+            in_run = False
+        elif in_run:
+            runs[-1].append(month)
+        else:
+            runs.append([month])
+            in_run = True
+    return runs
+
+def month_run_query(run: list, sku: str, region: str, ids: dict):
+    start = run[0]
+    end = (run[-1] + timedelta(days=32)).replace(day=1)
+    sql, params = monthly_sales_query(start, end, ids, rollup=True)
+    return ("monthly-sales", start, end, sku, region), sql, params
+
+def store_month_run(run: list, sku: str, region: str, rows: list, version) -> dict:
+    by_month = {r["month"]: r for r in rows}
+    cells = {month: by_month.get(f"{month:%Y-%m}") for month in run}
+    # version is read before the query. Closed-month cells never expire, so rows read
+    # across an ingest must not be written back after its invalidation ran
+    if version == data_version.current:
+        for month, row in cells.items():
+            set_month_cell(month, sku, region, row)
+    return cells
 
-def run_query(sql: str, params: dict = None):
-    from app.db import get_conn
-    with get_conn() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(sql, params)
-            cols = [d[0] for d in cursor.description]
-            return [dict(zip(cols, row)) for row in cursor.fetchall()]
+async def load_month_cells(run: list, sku: str, region: str, ids: dict, in_fan_out: bool = False) -> dict:
+    # One rollup query per run of consecutive missing months, shared by concurrent callers
+    key, sql, params = month_run_query(run, sku, region, ids)
+    
+    async def load():
+        version = data_version.current
+        # Next to the partial pieces of a fan-out, the run counts against FANOUT_CONNECTIONS
+        async with _fanout_slots if in_fan_out else nullcontext():
+            rows = await run_query(sql, params)
+        return store_month_run(run, sku, region, rows, version)
+    
+    return await asyncio.shield(single_flight(key, load))
+
+async def monthly_sales_by_month(start: date, end: date, sku: str, region: str, in_fan_out: bool = False) -> list:
+    """Assemble a month-aligned monthly-sales report from per-month cache cells."""
+    ids = dimensions.current.resolve(sku, region)
+    if ids is None:
+        return []
+    months = month_range(start, end)
+    cells = get_month_cells(months, sku, region)
+    for run in missing_month_runs(months, cells):
+        cells.update(await load_month_cells(run, sku, region, ids, in_fan_out))
+    return [cells[month] for month in months if cells[month] is not None]
 
 @cached_report
-def cached_run_query(*, sql: str, params: dict):
-    return run_query(sql, params)
+async def cached_run_query(*, sql: str, params: dict):
+    return await run_query(sql, params)
+
+def month_pieces(start: date, end: date) -> list:
+    """Split [start, end) at month boundaries, only the first and last piece can be partial."""
+    pieces = []
+    while start < end:
+        piece_end = min((start.replace(day=1) + timedelta(days=32)).replace(day=1), end)
+        pieces.append((start, piece_end))
+        start = piece_end
+    return pieces
+
+def fanned_out(start_date: str, end_date: str):
+    """The month pieces of an unaligned range over several months, otherwise None."""
+    if is_month_aligned(start_date, end_date):
+        return None
+    try:
+        pieces = month_pieces(date.fromisoformat(start_date), date.fromisoformat(end_date))
+    except ValueError:
+        return None
+    return pieces if len(pieces) > 1 else None
+
+async def fan_out(queries: list) -> list:
+    """
+    Run [(sql, params)] at the same time, at most FANOUT_WORKERS on their own connections
+    and within the worker-wide FANOUT_CONNECTIONS. Each piece goes through the report
+    cache, so months shared with other ranges are reused.
+    """
+    semaphore = asyncio.Semaphore(FANOUT_WORKERS)
+    
+    async def run(sql, params):
+        async with semaphore, _fanout_slots:
+            return await cached_run_query(sql=sql, params=params)
+    
+    return await asyncio.gather(*(run(sql, params) for sql, params in queries))
+
+def is_whole_month(start: date, end: date) -> bool:
+    return start.day == 1 and end.day == 1
+
+async def monthly_sales_fanned_out(pieces: list, sku: str, region: str, ids: dict) -> list:
+    # Partial months are read from raw sales, whole ones (always consecutive) from the month cells
+    partial = [monthly_sales_query(start.isoformat(), end.isoformat(), ids) for start, end in pieces if not is_whole_month(start, end)]
+    whole = [start for start, end in pieces if is_whole_month(start, end)]
+    if not whole:
+        results = await fan_out(partial)
+    else:
+        whole_end = (whole[-1] + timedelta(days=32)).replace(day=1)
+        partial_rows, whole_rows = await asyncio.gather(
+            fan_out(partial), monthly_sales_by_month(whole[0], whole_end, sku, region, in_fan_out=True)
+        )
+        results = [*partial_rows, whole_rows]
+    return sorted((row for rows in results for row in rows), key=lambda row: row["month"])
+
+async def top_products_fanned_out(pieces: list, ids: dict, limit: int) -> list:
+    queries = []
+    for start, end in pieces:
+        params = {"start": start.isoformat(), "end": end.isoformat(), "region_id": ids["region_id"]}
+        sql = reports.product_totals_sql(region=ids["region_id"] is not None, rollup=is_whole_month(start, end))
+        queries.append((sql, params))
+    
+    totals = {}
+    for rows in await fan_out(queries):
+        for row in rows:
+            total = totals.get(row["product_id"])
+            if total is None:
+                totals[row["product_id"]] = [row["total_revenue"], row["total_quantity"]]
+            else:
+                total[0] += row["total_revenue"]
+                total[1] += row["total_quantity"]
+    top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1][0])
+    return [
+        {"product_id": product_id, "total_revenue": revenue, "total_quantity": quantity}
+        for product_id, (revenue, quantity) in top
+    ]
 
 @app.get("/reports/monthly-sales", response_model=MonthlySalesResponse)
-def monthly_sales(
+async def monthly_sales(
     start_date: str = Query(..., description="Start date in YYYY-MM-01 format"),
     end_date: str = Query(..., description="End date in YYYY-MM-01 format"),
     product_sku: Optional[str] = Query(None, description="Optional product SKU filter"),
-    region_code: Optional[str] = Query(None, description="Optional region code filter")
+    region_code: Optional[str] = Query(None, description="Optional region code filter"),
+    accuracy: Literal["exact", "approx"] = Query("exact", description="approx may estimate totals from a row sample"),
+    if_none_match: Optional[str] = Header(None)
 ):
+    sku, region = product_sku or "", region_code or ""
+    key = ("monthly-sales", start_date, end_date, sku, region)
+    if accuracy == "approx":
+        key += ("approx",)
+    else:
+        warmup.record(key)
+    headers = http_cache_headers(key, end_date)
+    if etag_matches(if_none_match, headers):
+        return Response(status_code=304, headers=headers)
+    # Cached bodies are answered before admission, so they keep flowing while the database is saturated
+    if (response := cached_response(key, headers)) is not None:
+        return response
+    async with admission.admit("monthly_sales"):
+        return await monthly_sales_body(key, start_date, end_date, sku, region, headers, accuracy)
+
+async def monthly_sales_body(key, start_date: str, end_date: str, sku: str, region: str, headers: dict, accuracy: str = "exact"):
+    # Checked again here, a request ahead in the admission queue may have just cached it
+    if (response := cached_response(key, headers)) is not None:
+        return response
+    
+    if accuracy == "approx" and (payload := await approx_report("monthly-sales", start_date, end_date, sku, region)):
+        return json_response(key, payload, headers)
+    if columnar.engine is not None:
+        rows = columnar.engine.monthly_sales(start_date, end_date, sku, region)
+    elif is_month_aligned(start_date, end_date):
+        rows = await monthly_sales_by_month(date.fromisoformat(start_date), date.fromisoformat(end_date), sku, region)
+    elif (ids := dimensions.current.resolve(sku, region)) is None:
+        rows = []
+    elif pieces := fanned_out(start_date, end_date):
+        rows = await monthly_sales_fanned_out(pieces, sku, region, ids)
+    else:
+        sql, params = monthly_sales_query(start_date, end_date, ids)
+        rows = await cached_run_query(sql=sql, params=params)
+    return json_response(key, exact_payload(rows, accuracy), headers)
+
+def monthly_sales_query(start, end, ids: dict, rollup: bool = False):
     params = {
-        "start": start_date,
-        "end": end_date,
-        "sku": product_sku or "",
-        "region": region_code or ""
+        "start": start,
+        "end": end,
+        **ids
     }
-    rows = cached_run_query(sql=reports.MONTHLY_SALES, params=params)
-    return MonthlySalesResponse(rows=[MonthRow(**r) for r in rows])
+    sql = reports.monthly_sales_sql(sku=ids["product_id"] is not None, region=ids["region_id"] is not None, rollup=rollup)
+    return sql, params
 
 @app.get("/reports/top-products", response_model=TopProductsResponse)
-def top_products(
+async def top_products(
     start_date: str = Query(..., description="Start date in YYYY-MM-01 format"),
     end_date: str = Query(..., description="End date in YYYY-MM-01 format"),
     region_code: Optional[str] = Query(None, description="Optional region code filter"),
-    limit: int = Query(default=5, ge=1, le=50, description="Number of top products to return (1-50)")
+    limit: int = Query(default=5, ge=1, le=50, description="Number of top products to return (1-50)"),
+    accuracy: Literal["exact", "approx"] = Query("exact", description="approx may estimate totals from a row sample"),
+    if_none_match: Optional[str] = Header(None)
 ):
+    key = ("top-products", start_date, end_date, region_code or "", limit)
+    if accuracy == "approx":
+        key += ("approx",)
+    else:
+        warmup.record(key)
+    headers = http_cache_headers(key, end_date)
+    if etag_matches(if_none_match, headers):
+        return Response(status_code=304, headers=headers)
+    if (response := cached_response(key, headers)) is not None:
+        return response
+    async with admission.admit("top_products"):
+        return await top_products_body(key, start_date, end_date, region_code, limit, headers, accuracy)
+
+async def top_products_body(key, start_date: str, end_date: str, region_code: Optional[str], limit: int, headers: dict, accuracy: str = "exact"):
+    if (response := cached_response(key, headers)) is not None:
+        return response
+    
+    if accuracy == "approx" and (payload := await approx_report("top-products", start_date, end_date, "", region_code or "", limit)):
+        return json_response(key, payload, headers)
+    if columnar.engine is not None:
+        rows = columnar.engine.top_products(start_date, end_date, region_code or "", limit)
+    elif (ids := dimensions.current.resolve(region=region_code or "")) is None:
+        rows = []
+    elif pieces := fanned_out(start_date, end_date):
+        rows = dimensions.current.decorate_products(await top_products_fanned_out(pieces, ids, limit))
+    else:
+        sql, params = top_products_query(start_date, end_date, ids, limit)
+        rows = dimensions.current.decorate_products(await cached_run_query(sql=sql, params=params))
+    return json_response(key, exact_payload(rows, accuracy), headers)
+
+def top_products_query(start_date: str, end_date: str, ids: dict, limit: int):
     params = {
         "start": start_date,
         "end": end_date,
-        "region": region_code or "",
+        "region_id": ids["region_id"],
         "limit": limit
     }
-    rows = cached_run_query(sql=reports.TOP_PRODUCTS, params=params)
-    return TopProductsResponse(rows=[TopProductRow(**r) for r in rows])
+    sql = reports.top_products_sql(region=ids["region_id"] is not None, rollup=is_month_aligned(start_date, end_date))
+    return sql, params
+
+def timeseries_rows(start_date: str, end_date: str, granularity: str, group_by: str, ids: dict) -> int:
+    """Most rows a timeseries can return: every bucket times every breakdown key and total."""
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        return 0
+    if end <= start:
+        return 0
+    last = end - timedelta(days=1)
+    if granularity == "day":
+        buckets = (end - start).days
+    elif granularity == "week":
+        buckets = (last - (start - timedelta(days=start.weekday()))).days // 7 + 1
+    else:
+        months = (last.year - start.year) * 12 + last.month - start.month
+        if granularity == "quarter":
+            months = (last.year - start.year) * 4 + (last.month - 1) // 3 - (start.month - 1) // 3
+        buckets = months + 1
+    # Every key of a dimension plus its NULL total, a filter leaves one key
+    regions = (1 if ids["region_id"] is not None else len(dimensions.current.regions)) + 1
+    products = (1 if ids["product_id"] is not None else len(dimensions.current.products)) + 1
+    keys = {"none": 1, "region": regions, "product": products, "both": regions * products}[group_by]
+    return buckets * keys
+
+@app.get("/reports/timeseries", response_model=TimeseriesResponse)
+async def timeseries(
+    start_date: str = Query(..., description="Start date in YYYY-MM-DD format"),
+    end_date: str = Query(..., description="End date (exclusive) in YYYY-MM-DD format"),
+    granularity: Literal["day", "week", "month", "quarter"] = Query("month", description="Bucket size"),
+    group_by: Literal["none", "region", "product", "both"] = Query("none", description="Breakdown within each bucket"),
+    product_sku: Optional[str] = Query(None, description="Optional product SKU filter"),
+    region_code: Optional[str] = Query(None, description="Optional region code filter"),
+    if_none_match: Optional[str] = Header(None)
+):
+    sku, region = product_sku or "", region_code or ""
+    key = ("timeseries", start_date, end_date, granularity, group_by, sku, region)
+    headers = http_cache_headers(key, end_date)
+    if etag_matches(if_none_match, headers):
+        return Response(status_code=304, headers=headers)
+    if (response := cached_response(key, headers)) is not None:
+        return response
+    
+    # Always answered in SQL, a single grouped scan already returns every series at once
+    if (ids := dimensions.current.resolve(sku, region)) is None:
+        rows = []
+    else:
+        if (estimate := timeseries_rows(start_date, end_date, granularity, group_by, ids)) > TIMESERIES_MAX_ROWS:
+            raise HTTPException(status_code=422, detail=(
+                f"Up to {estimate} rows requested, the limit is {TIMESERIES_MAX_ROWS}. "
+                "Narrow the range, use a coarser granularity or filter by product_sku/region_code"
+            ))
+        params = {
+            "start": start_date,
+            "end": end_date,
+            **ids
+        }
+        rollup = granularity in ("month", "quarter") and is_month_aligned(start_date, end_date)
+        sql = reports.timeseries_sql(
+            granularity, group_by, sku=ids["product_id"] is not None, region=ids["region_id"] is not None, rollup=rollup
+        )
+        async with admission.admit("timeseries"):
+            rows = await cached_run_query(sql=sql, params=params)
+    return json_response(key, {
+        "granularity": granularity,
+        "group_by": group_by,
+        "columns": dimensions.current.timeseries_columns(rows, group_by),
+    }, headers)
+
+def exact_payload(rows: list, accuracy: str) -> dict:
+    # Exact responses only mention accuracy when approx was asked for and not worth it
+    return {"rows": rows, "approximate": False} if accuracy == "approx" else {"rows": rows}
+
+async def approx_report(report: str, start_date: str, end_date: str, sku: str, region: str, limit: int = None):
+    """
+    Payload of a report estimated from a row sample, or None when the exact report is as
+    cheap: the NumPy engine and the month rollup are already fast, small ranges are not
+    worth sampling, and unknown codes are answered without the database anyway.
+    """
+    if columnar.engine is not None or is_month_aligned(start_date, end_date):
+        return None
+    if (ids := dimensions.current.resolve(sku, region)) is None:
+        return None
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        return None
+    
+    matching = approx.estimated_rows(await run_query(reports.PARTITION_ROWS), start, end)
+    if ids["product_id"] is not None:
+        matching /= len(dimensions.current.products)
+    if ids["region_id"] is not None:
+        matching /= len(dimensions.current.regions)
+    if (percent := approx.sample_percent(matching)) is None:
+        return None
+    
+    params = {
+        "start": start_date,
+        "end": end_date,
+        "percent": percent,
+        "seed": approx.SEED,
+        **ids
+    }
+    if report == "monthly-sales":
+        sql = reports.monthly_sales_sample_sql(sku=ids["product_id"] is not None, region=ids["region_id"] is not None)
+        rows = approx.scale_rows(await cached_run_query(sql=sql, params=params), percent)
+    else:
+        sql = reports.top_products_sample_sql(region=ids["region_id"] is not None)
+        rows = await cached_run_query(sql=sql, params={**params, "limit": limit})
+        rows = dimensions.current.decorate_products(approx.scale_rows(rows, percent))
+    return {"rows": rows, "approximate": True, "sample_percent": percent}
+
+async def run_pipeline(queries: dict) -> dict:
+    """Run {key: (sql, params)} on one connection in pipeline mode, returning {key: rows}."""
+    if not queries:
+        return {}
+    async with get_conn() as conn:
+        cursors = {}
+        # Statements are sent back to back and the results read after a single sync
+        with phase("sql"):
+            async with conn.pipeline():
+                for key, (sql, params) in queries.items():
+                    cursors[key] = cursor = conn.cursor()
+                    await cursor.execute(sql, params, prepare=True)
+        results = {}
+        with phase("build"):
+            for key, cursor in cursors.items():
+                cols = [d[0] for d in cursor.description]
+                results[key] = [dict(zip(cols, row)) for row in await cursor.fetchall()]
+                await cursor.close()
+        return results
+
+# Leaves out the approximate-only fields, which batch reports never fill
+@app.post("/reports/batch", response_model=BatchResponse, response_model_exclude_none=True)
+async def batch_reports(batch: BatchRequest):
+    """Run many report specs at once, identical specs and cached results are only resolved once."""
+    if columnar.engine is not None:
+        rows = [
+            columnar.engine.monthly_sales(spec.start_date, spec.end_date, spec.product_sku or "", spec.region_code or "")
+            if spec.report == "monthly-sales" else
+            columnar.engine.top_products(spec.start_date, spec.end_date, spec.region_code or "", spec.limit)
+            for spec in batch.reports
+        ]
+        return batch_response(batch, rows, decorate=False)
+    
+    # First pass: resolve what we can from the caches and collect the queries for the rest
+    queries = {}
+    plans = []
+    for spec in batch.reports:
+        sku = (spec.product_sku or "") if spec.report == "monthly-sales" else ""
+        region = spec.region_code or ""
+        ids = dimensions.current.resolve(sku, region)
+        if ids is None:
+            plans.append(("report", None, []))
+            continue
+        
+        if spec.report == "monthly-sales" and is_month_aligned(spec.start_date, spec.end_date):
+            months = month_range(date.fromisoformat(spec.start_date), date.fromisoformat(spec.end_date))
+            cells = get_month_cells(months, sku, region)
+            runs = [month_run_query(run, sku, region, ids) for run in missing_month_runs(months, cells)]
+            for key, sql, params in runs:
+                queries[key] = (sql, params)
+            plans.append(("cells", months, cells, runs, sku, region))
+            continue
+        
+        if spec.report == "monthly-sales":
+            sql, params = monthly_sales_query(spec.start_date, spec.end_date, ids)
+        else:
+            sql, params = top_products_query(spec.start_date, spec.end_date, ids, spec.limit)
+        key = report_key(sql, params)
+        rows = await get_report(key) if key not in queries else None
+        if rows is None:
+            queries[key] = (sql, params)
+        plans.append(("report", key, rows))
+    
+    fetched = {}
+    version = data_version.current
+    if queries:
+        async with admission.admit("batch_reports"):
+            fetched = await run_pipeline(queries)
+    
+    # Second pass: store what was fetched and assemble the rows in request order
+    results = []
+    for plan in plans:
+        if plan[0] == "cells":
+            _, months, cells, runs, sku, region = plan
+            for key, _, params in runs:
+                run = month_range(params["start"], params["end"])
+                cells.update(store_month_run(run, sku, region, fetched[key], version))
+            results.append([cells[month] for month in months if cells[month] is not None])
+        else:
+            _, key, rows = plan
+            if rows is None:
+                rows = fetched[key]
+                put_report(key, rows, version)
+            results.append(rows)
+    return batch_response(batch, results)
+
+def batch_response(batch: BatchRequest, results: list, decorate: bool = True) -> BatchResponse:
+    with phase("serialize"):
+        return BatchResponse(results=[
+            MonthlySalesResponse(rows=[MonthRow(**r) for r in rows])
+            if spec.report == "monthly-sales" else
+            TopProductsResponse(rows=[
+                TopProductRow(**r) for r in (dimensions.current.decorate_products(rows) if decorate else rows)
+            ])
+            for spec, rows in zip(batch.reports, results)
+        ])
+
+def export_pieces(start_date: str, end_date: str) -> list:
+    # One query per month: each prunes to a single partition and sorts only that month,
+    # so rows start streaming before the rest of the range has been read
+    try:
+        return month_pieces(date.fromisoformat(start_date), date.fromisoformat(end_date))
+    except ValueError:
+        return [(start_date, end_date)]
+
+async def stream_rows(sql: str, params: dict, fmt: str):
+    # A named cursor keeps the result set on the server, so only one batch is in memory at a time.
+    # Named cursors need a transaction, the pool hands out autocommit connections
+    header = fmt == "csv"
+    async with get_conn() as conn:
+        async with conn.transaction():
+            for start, end in export_pieces(params["start"], params["end"]):
+                async with conn.cursor(name="sales_export") as cursor:
+                    await cursor.execute(sql, {**params, "start": start, "end": end})
+                    cols = [d[0] for d in cursor.description]
+                    if header:
+                        yield ",".join(cols).encode() + b"\r\n"
+                        header = False
+                    while rows := await cursor.fetchmany(EXPORT_BATCH_SIZE):
+                        if fmt == "csv":
+                            buf = io.StringIO()
+                            csv.writer(buf).writerows(rows)
+                            yield buf.getvalue().encode()
+                        else:
+                            yield b"".join(to_json(dict(zip(cols, row))) + b"\n" for row in rows)
+
+@app.get("/exports/sales")
+async def export_sales(
+    start_date: str = Query(..., description="Start date in YYYY-MM-DD format"),
+    end_date: str = Query(..., description="End date (exclusive) in YYYY-MM-DD format"),
+    product_sku: Optional[str] = Query(None, description="Optional product SKU filter"),
+    region_code: Optional[str] = Query(None, description="Optional region code filter"),
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Output format")
+):
+    ids = dimensions.current.resolve(product_sku or "", region_code or "")
+    if ids is None:
+        # Unknown codes match nothing, CSV still gets its header line
+        body = [",".join(reports.EXPORT_COLUMNS).encode() + b"\r\n"] if format == "csv" else []
+        rows = iter(body)
+    else:
+        params = {
+            "start": start_date,
+            "end": end_date,
+            **ids
+        }
+        sql = reports.export_sales_sql(sku=ids["product_id"] is not None, region=ids["region_id"] is not None)
+        rows = stream_rows(sql, params, format)
+    if format == "csv":
+        return StreamingResponse(
+            rows,
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="sales.csv"'}
+        )
+    return StreamingResponse(rows, media_type="application/x-ndjson")
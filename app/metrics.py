@@ -0,0 +1,123 @@
+"""
+Per-request phase timings and Prometheus histograms.
+
+TimingMiddleware gives every request a dict in a context variable. Code on the request
+path adds to it with `with phase("sql"):` or `record_phase("pool", seconds)`, and notes
+the cache outcome with `note_cache("hit")`. When the response starts, the timings go into
+a Server-Timing header. When it finishes, they go into the histograms served by
+/metrics. A phase costs two perf_counter() calls and a dict update.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+# Seconds, from sub-millisecond cache hits to multi-second cold scans
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Phases recorded on the report path, in Server-Timing order
+PHASES = ("pool", "sql", "build", "serialize")
+
+_timings: ContextVar = ContextVar("timings", default=None)
+
+class Histogram:
+    """A labelled Prometheus histogram with fixed buckets."""
+
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # label values -> [bucket counts..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(BUCKETS) + 2)
+        series[bisect_left(BUCKETS, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.series.items():
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += series[len(BUCKETS)]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time from request to end of response body.", ("route", "cache"))
+phase_duration = Histogram(
+    "report_phase_duration_seconds", "Time spent per phase while serving a request.", ("route", "phase"))
+
+def record_phase(name: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def phase(name: str):
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, perf_counter() - started)
+
+def note_cache(outcome: str):
+    """Record "hit" or "miss" for the current request, the first outcome wins."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.setdefault("cache", outcome)
+
+def server_timing(timings: dict, total: float) -> bytes:
+    parts = [f"{name};dur={timings[name] * 1000:.3f}" for name in PHASES if name in timings]
+    if "cache" in timings:
+        parts.append(f"cache;desc={timings['cache']}")
+    parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts).encode()
+
+class TimingMiddleware:
+    """Pure ASGI middleware, cheaper than BaseHTTPMiddleware since the body is not re-wrapped."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = {}
+        token = _timings.set(timings)
+        started = perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = server_timing(timings, perf_counter() - started)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            # FastAPI puts the matched route in the scope, unmatched paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe(perf_counter() - started, route, timings.get("cache", "none"))
+            for name in PHASES:
+                if name in timings:
+                    phase_duration.observe(timings[name], route, name)
+
+def render(gauges: dict, extra: list = ()) -> str:
+    """Prometheus text format for the histograms, {name: (help, value)} gauges and extra lines."""
+    lines = request_duration.render() + phase_duration.render()
+    for name, (help, value) in gauges.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+    lines += extra
+    return "\n".join(lines) + "\n"
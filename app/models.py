@@ -1,19 +1,56 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal, Union
 
 class MonthRow(BaseModel):
     month: str
     total_revenue: int
     total_quantity: int
+    # [low, high] 95% interval, only on approximate responses
+    total_revenue_ci: Optional[List[int]] = None
+    total_quantity_ci: Optional[List[int]] = None
 
 class MonthlySalesResponse(BaseModel):
     rows: List[MonthRow]
+    # Only present when accuracy=approx was requested, false if the exact report was served
+    approximate: Optional[bool] = None
+    sample_percent: Optional[float] = None
 
 class TopProductRow(BaseModel):
     product_sku: str
     product_name: str
     total_revenue: int
     total_quantity: int
+    total_revenue_ci: Optional[List[int]] = None
+    total_quantity_ci: Optional[List[int]] = None
 
 class TopProductsResponse(BaseModel):
     rows: List[TopProductRow]
+    approximate: Optional[bool] = None
+    sample_percent: Optional[float] = None
+
+class TimeseriesColumns(BaseModel):
+    bucket: List[str]
+    region_code: Optional[List[Optional[str]]] = None
+    product_sku: Optional[List[Optional[str]]] = None
+    total_revenue: List[int]
+    total_quantity: List[int]
+
+class TimeseriesResponse(BaseModel):
+    granularity: str
+    group_by: str
+    # One list per column, null region_code/product_sku mark the totals over that dimension
+    columns: TimeseriesColumns
+
+class ReportSpec(BaseModel):
+    report: Literal["monthly-sales", "top-products"]
+    start_date: str
+    end_date: str
+    product_sku: Optional[str] = None
+    region_code: Optional[str] = None
+    limit: int = Field(default=5, ge=1, le=50)
+
+class BatchRequest(BaseModel):
+    reports: List[ReportSpec] = Field(..., min_length=1, max_length=50)
+
+class BatchResponse(BaseModel):
+    results: List[Union[MonthlySalesResponse, TopProductsResponse]]
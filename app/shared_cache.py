@@ -0,0 +1,288 @@
+"""
+Report results shared by every uvicorn worker on a host (CACHE_BACKEND=sqlite).
+
+The store is an SQLite file in WAL mode, so readers never block. Each process opens its
+own connections, and their writers take turns on SQLite's write lock for up to the busy
+timeout. A process forked after using the store does not reuse the parent's connections
+or threads, it leaves them untouched and opens its own (uvicorn spawns its workers, so
+this only matters to code that forks). cached_report uses the store as a second tier.
+A miss in the worker's own report cache looks here before querying, and query results
+are written to both.
+
+None of this runs on the event loop. Lookups run on SHARED_READERS reader threads with a
+busy timeout of a few milliseconds. Writes, purges and invalidations go through one
+writer thread per process, which takes the file lock and can wait out contention. When
+its queue is full, a write is dropped, since the result is still cached locally.
+
+Entries are stored under the data version they were computed from and only read back
+under that version. An ingest bumps the version, which retires every older entry for
+all workers at once, with no cross-process invalidation. Values are JSON, with dates and
+decimals tagged so they come back with their types. Values from CACHE_COMPRESS_MIN_BYTES
+up are zlib-compressed. Nothing read from the file is ever unpickled.
+
+By default the file lives in a per-user directory (0700) under /dev/shm, and the file
+itself is 0600. A directory or file owned by another user, a directory others can write
+to, or a symlink in place of either disables the shared tier instead of being opened.
+Any SQLite error makes the lookup a miss, so the store never fails a request.
+"""
+
+import os
+import json
+import stat
+import time
+import queue
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+def default_path() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"clue-report-cache-{os.getuid()}", "reports.sqlite3")
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SHARED_PATH = os.getenv("CACHE_SHARED_PATH") or default_path()
+# Old versions and expired entries are purged every SHARED_PURGE_EVERY writes, then the
+# oldest entries go until the store is under CACHE_SHARED_MAX_BYTES
+CACHE_SHARED_MAX_BYTES = int(os.getenv("CACHE_SHARED_MAX_BYTES", 512 * 1024 * 1024))
+SHARED_PURGE_EVERY = 200
+# Lookups give up almost at once, a miss only costs the query the caller would run anyway
+SHARED_READ_BUSY_SECONDS = 0.005
+SHARED_WRITE_BUSY_SECONDS = 1.0
+SHARED_WRITE_QUEUE = 1000
+# Lookups are a few milliseconds at most, a couple of threads keep up with a worker
+SHARED_READERS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key BLOB PRIMARY KEY,
+    version INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    range_start TEXT,
+    range_end TEXT,
+    compressed INTEGER NOT NULL,
+    value BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at);
+"""
+
+enabled = CACHE_BACKEND == "sqlite"
+
+# Writes dropped because the writer thread fell behind
+dropped_writes = 0
+
+# One connection per reader or writer thread, the reader pool and the writer's queue
+_local = threading.local()
+_readers = None
+_writes = None
+_threads_lock = threading.Lock()
+# Every connection this process opened. The threads are long-lived, so this stays at
+# SHARED_READERS + 1, and it keeps connections open until the process exits
+_connections = []
+# Connections inherited across a fork. SQLite handles must not be used in the child, and
+# closing one there (as freeing a dead thread's locals would) can checkpoint or drop the
+# POSIX locks that other connections to the same file rely on. They stay referenced and
+# are never touched again
+_inherited = []
+
+def _after_fork_in_child():
+    global _local, _readers, _writes, _threads_lock, _connections
+    _inherited.append(_connections)
+    _connections = []
+    _local = threading.local()
+    # Neither the reader nor the writer threads survived the fork, and the lock may have been held
+    _readers, _writes, _threads_lock = None, None, threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+class UnsafeStore(PermissionError):
+    """The store's file or directory could be read or replaced by another user."""
+
+def prepare(path: str):
+    """Create the store's directory (0700) and file (0600), refusing ones another user controls."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise UnsafeStore(f"{directory} must be a directory owned by uid {os.getuid()} that only it can write to")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        if os.fstat(fd).st_uid != os.getuid():
+            raise UnsafeStore(f"{path} is owned by another user")
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+def connection(busy_seconds: float) -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        prepare(CACHE_SHARED_PATH)
+        # Workers starting together contend for the WAL switch and the schema, setup may wait
+        conn = sqlite3.connect(CACHE_SHARED_PATH, timeout=SHARED_WRITE_BUSY_SECONDS, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last writes on a power cut only costs cache misses
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA busy_timeout = {int(busy_seconds * 1000)}")
+        _connections.append(conn)
+        _local.conn = conn
+    return conn
+
+def disable(exc: OSError):
+    global enabled
+    enabled = False
+    logger.error("Shared report cache disabled: %s", exc)
+
+def digest(key) -> bytes:
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+def _tag(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError(f"{type(value).__name__} cannot be stored in the shared cache")
+
+TAGS = {"$datetime": datetime.fromisoformat, "$date": date.fromisoformat, "$decimal": Decimal}
+
+def _untag(obj: dict):
+    if len(obj) == 1:
+        (tag, text), = obj.items()
+        if tag in TAGS:
+            return TAGS[tag](text)
+    return obj
+
+def encode(value) -> bytes:
+    return json.dumps(value, default=_tag, separators=(",", ":")).encode()
+
+def decode(blob: bytes):
+    return json.loads(blob, object_hook=_untag)
+
+async def get(key, version: int):
+    """Return (value, age in seconds) stored for key under version, or None."""
+    return await asyncio.get_running_loop().run_in_executor(readers(), _get, key, version)
+
+def _get(key, version: int):
+    try:
+        row = connection(SHARED_READ_BUSY_SECONDS).execute(
+            "SELECT stored_at, compressed, value FROM entries WHERE key = ? AND version = ?",
+            (digest(key), version)
+        ).fetchone()
+        if row is None:
+            return None
+        stored_at, compressed, blob = row
+        return decode(zlib.decompress(blob) if compressed else blob), time.time() - stored_at
+    except OSError as exc:
+        disable(exc)
+    except (sqlite3.Error, zlib.error, ValueError):
+        logger.exception("Shared cache read failed")
+    return None
+
+def put(key, version: int, value, *, compress_min_bytes: int, max_age: float, start=None, end=None):
+    """Queue value for the writer thread, encoding and the file lock are taken there."""
+    global dropped_writes
+    try:
+        writes().put_nowait((_put, (key, version, value, compress_min_bytes, max_age, _iso(start), _iso(end))))
+    except queue.Full:
+        dropped_writes += 1
+
+def _put(key, version, value, compress_min_bytes, max_age, start, end):
+    blob = encode(value)
+    compressed = bool(compress_min_bytes) and len(blob) >= compress_min_bytes
+    if compressed:
+        blob = zlib.compress(blob, 1)
+    conn = connection(SHARED_WRITE_BUSY_SECONDS)
+    conn.execute(
+        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (digest(key), version, time.time(), start, end, compressed, blob)
+    )
+    _local.writes = getattr(_local, "writes", 0) + 1
+    if _local.writes % SHARED_PURGE_EVERY == 0:
+        purge(conn, version, max_age)
+
+def purge(conn: sqlite3.Connection, version: int, max_age: float):
+    conn.execute("DELETE FROM entries WHERE version <> ? OR stored_at < ?", (version, time.time() - max_age))
+    size = conn.execute("SELECT COALESCE(SUM(length(value)), 0) FROM entries").fetchone()[0]
+    if size > CACHE_SHARED_MAX_BYTES:
+        # Go down to half the budget in one statement, so the next purges have room to spare
+        conn.execute("""
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(length(value)) OVER (ORDER BY stored_at) AS running
+                    FROM entries
+                ) WHERE running <= ?
+            )
+        """, (size - CACHE_SHARED_MAX_BYTES // 2,))
+
+async def invalidate(start=None, end=None) -> int:
+    """Drop entries overlapping [start, end), after the writes queued before it."""
+    done = asyncio.get_running_loop().create_future()
+    # Unlike a write, an invalidation is never dropped, wait for room off the event loop
+    await asyncio.to_thread(writes().put, (_invalidate, (_iso(start), _iso(end), done)))
+    return await done
+
+def _invalidate(start, end, done):
+    dropped = 0
+    try:
+        # Entries without a range always go
+        dropped = connection(SHARED_WRITE_BUSY_SECONDS).execute("""
+            DELETE FROM entries
+            WHERE range_start IS NULL OR range_end IS NULL
+               OR (range_start < COALESCE(?, '9999-12-31') AND range_end > COALESCE(?, '0001-01-01'))
+        """, (end, start)).rowcount
+    finally:
+        done.get_loop().call_soon_threadsafe(_resolve, done, dropped)
+
+def _resolve(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+def readers() -> ThreadPoolExecutor:
+    global _readers
+    with _threads_lock:
+        if _readers is None:
+            _readers = ThreadPoolExecutor(SHARED_READERS, thread_name_prefix="shared-cache-reader")
+    return _readers
+
+def writes() -> queue.Queue:
+    """The queue of the process's writer thread, started on first use."""
+    global _writes
+    with _threads_lock:
+        if _writes is None:
+            _writes = queue.Queue(SHARED_WRITE_QUEUE)
+            threading.Thread(target=_write_loop, args=(_writes,), name="shared-cache-writer", daemon=True).start()
+    return _writes
+
+def _write_loop(jobs: queue.Queue):
+    while True:
+        job, args = jobs.get()
+        try:
+            job(*args)
+        except OSError as exc:
+            disable(exc)
+        except Exception:
+            # Keep the thread alive, a failed write only costs later misses
+            logger.exception("Shared cache write failed")
+        finally:
+            jobs.task_done()
+
+def flush():
+    """Block until the queued writes are in the file (tests and benchmarks)."""
+    if _writes is not None:
+        _writes.join()
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
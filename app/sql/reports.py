@@ -1,30 +1,224 @@
+"""
+Report SQL is built per filter combination instead of using catch-all predicates like
+(%(sku)s = '' OR p.sku = %(sku)s). Each variant only filters on what it needs, which
+keeps generic plans of prepared statements able to use the per-partition
+(product_id, sale_date) / (region_id, sale_date) indexes.
+
+SKU and region codes are resolved to ids by app.dimensions before querying, so report
+queries never join products or regions.
+"""
+
+PRODUCT_FILTER = "AND s.product_id = %(product_id)s"
+REGION_FILTER = "AND s.region_id = %(region_id)s"
+
+# Raw sales partitions, or the sales_monthly_agg rollup for month-aligned ranges
+RAW_SOURCE = {
+    "table": "sales s",
+    "date": "s.sale_date",
+    "month": "date_trunc('month', s.sale_date)",
+    "revenue": "SUM(s.quantity * s.unit_price)",
+    "quantity": "SUM(s.quantity)",
+}
+ROLLUP_SOURCE = {
+    "table": "sales_monthly_agg s",
+    "date": "s.month",
+    "month": "s.month",
+    "revenue": "SUM(s.total_revenue)",
+    "quantity": "SUM(s.total_quantity)",
+}
+
 MONTHLY_SALES = """
-SELECT to_char(date_trunc('month', s.sale_date), 'YYYY-MM') AS month,
-       SUM(s.quantity * s.unit_price)::bigint AS total_revenue,
-       SUM(s.quantity)::bigint AS total_quantity
-FROM sales s
-JOIN products p ON p.id = s.product_id
-JOIN regions  r ON r.id = s.region_id
-WHERE s.sale_date >= %(start)s
-  AND s.sale_date <  %(end)s
-  AND (%(sku)s = '' OR p.sku = %(sku)s)
-  AND (%(region)s = '' OR r.code = %(region)s)
-GROUP BY month
-ORDER BY month;
+SELECT to_char({month}, 'YYYY-MM') AS month,
+       {revenue}::bigint AS total_revenue,
+       {quantity}::bigint AS total_quantity
+FROM {table}
+WHERE {date} >= %(start)s
+  AND {date} <  %(end)s
+  {filters}
+GROUP BY 1
+ORDER BY 1;
 """
 
+# Rows only carry product_id, sku and name are filled in from the dimension cache
 TOP_PRODUCTS = """
-SELECT p.sku AS product_sku,
-       p.name AS product_name,
-       SUM(s.quantity * s.unit_price)::bigint AS total_revenue,
-       SUM(s.quantity)::bigint AS total_quantity
+SELECT s.product_id,
+       {revenue}::bigint AS total_revenue,
+       {quantity}::bigint AS total_quantity
+FROM {table}
+WHERE {date} >= %(start)s
+  AND {date} <  %(end)s
+  {filters}
+GROUP BY s.product_id
+ORDER BY total_revenue DESC
+LIMIT %(limit)s;
+"""
+
+# Per-product totals of one month piece of a fanned-out top-products report,
+# merged and ranked in Python
+PRODUCT_TOTALS = """
+SELECT s.product_id,
+       {revenue}::bigint AS total_revenue,
+       {quantity}::bigint AS total_quantity
+FROM {table}
+WHERE {date} >= %(start)s
+  AND {date} <  %(end)s
+  {filters}
+GROUP BY s.product_id;
+"""
+
+def monthly_sales_sql(sku: bool = False, region: bool = False, rollup: bool = False) -> str:
+    filters = []
+    if sku:
+        filters.append(PRODUCT_FILTER)
+    if region:
+        filters.append(REGION_FILTER)
+    source = ROLLUP_SOURCE if rollup else RAW_SOURCE
+    return MONTHLY_SALES.format(filters="\n  ".join(filters), **source)
+
+def top_products_sql(region: bool = False, rollup: bool = False) -> str:
+    source = ROLLUP_SOURCE if rollup else RAW_SOURCE
+    return TOP_PRODUCTS.format(filters=REGION_FILTER if region else "", **source)
+
+def product_totals_sql(region: bool = False, rollup: bool = False) -> str:
+    source = ROLLUP_SOURCE if rollup else RAW_SOURCE
+    return PRODUCT_TOTALS.format(filters=REGION_FILTER if region else "", **source)
+
+# accuracy=approx reads a Bernoulli sample of the raw rows: each row is kept independently
+# with probability percent/100, so the sums scale by 100/percent and their variance can be
+# estimated from the sums of squares. REPEATABLE keeps the sample of a given range stable
+SAMPLE_SOURCE = {
+    **RAW_SOURCE,
+    "table": "sales s TABLESAMPLE BERNOULLI (%(percent)s) REPEATABLE (%(seed)s)",
+    "revenue": "SUM((s.quantity * s.unit_price)::float8)",
+    "quantity": "SUM(s.quantity::float8)",
+}
+
+SAMPLE_MOMENTS = """SUM((s.quantity * s.unit_price)::float8 ^ 2) AS total_revenue_sq,
+       SUM(s.quantity::float8 ^ 2) AS total_quantity_sq"""
+
+MONTHLY_SALES_SAMPLE = """
+SELECT to_char({month}, 'YYYY-MM') AS month,
+       {revenue} AS total_revenue,
+       {quantity} AS total_quantity,
+       {moments}
+FROM {table}
+WHERE {date} >= %(start)s
+  AND {date} <  %(end)s
+  {filters}
+GROUP BY 1
+ORDER BY 1;
+"""
+
+# Scaling is the same for every product, so ranking the sample sums ranks the estimates
+TOP_PRODUCTS_SAMPLE = """
+SELECT s.product_id,
+       {revenue} AS total_revenue,
+       {quantity} AS total_quantity,
+       {moments}
+FROM {table}
+WHERE {date} >= %(start)s
+  AND {date} <  %(end)s
+  {filters}
+GROUP BY s.product_id
+ORDER BY total_revenue DESC
+LIMIT %(limit)s;
+"""
+
+def monthly_sales_sample_sql(sku: bool = False, region: bool = False) -> str:
+    filters = []
+    if sku:
+        filters.append(PRODUCT_FILTER)
+    if region:
+        filters.append(REGION_FILTER)
+    return MONTHLY_SALES_SAMPLE.format(filters="\n  ".join(filters), moments=SAMPLE_MOMENTS, **SAMPLE_SOURCE)
+
+def top_products_sample_sql(region: bool = False) -> str:
+    return TOP_PRODUCTS_SAMPLE.format(filters=REGION_FILTER if region else "", moments=SAMPLE_MOMENTS, **SAMPLE_SOURCE)
+
+# Planner row estimates of every sales partition, refreshed by VACUUM/ANALYZE after each load
+PARTITION_ROWS = """
+SELECT to_date(substring(c.relname FROM 'sales_(\\d{4}_\\d{2})'), 'YYYY_MM') AS month,
+       GREATEST(c.reltuples, 0)::float8 AS estimated_rows
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'sales'::regclass;
+"""
+
+# Breakdowns per bucket in one grouped scan: ROLLUP/CUBE adds the total (and for "both"
+# the per-region and per-product) series, marked by NULL ids since the real ids are NOT NULL
+TIMESERIES_GROUPS = {
+    "none": [],
+    "region": ["s.region_id"],
+    "product": ["s.product_id"],
+    "both": ["s.region_id", "s.product_id"],
+}
+
+TIMESERIES = """
+SELECT {bucket} AS bucket,
+       {dims}{revenue}::bigint AS total_revenue,
+       {quantity}::bigint AS total_quantity
+FROM {table}
+WHERE {date} >= %(start)s
+  AND {date} <  %(end)s
+  {filters}
+GROUP BY {group_by}
+ORDER BY {order_by};
+"""
+
+def timeseries_bucket(granularity: str, rollup: bool = False) -> str:
+    column = "s.month" if rollup else "s.sale_date"
+    if granularity == "day" or (rollup and granularity == "month"):
+        return column
+    # Truncating a timestamp is cheaper than date_trunc on a date, which goes through timestamptz
+    return f"date_trunc('{granularity}', {column}::timestamp)::date"
+
+def timeseries_sql(granularity: str, group_by: str, sku: bool = False, region: bool = False, rollup: bool = False) -> str:
+    filters = []
+    if sku:
+        filters.append(PRODUCT_FILTER)
+    if region:
+        filters.append(REGION_FILTER)
+    dims = TIMESERIES_GROUPS[group_by]
+    if len(dims) == 2:
+        grouping = f"1, CUBE ({', '.join(dims)})"
+    elif dims:
+        grouping = f"1, ROLLUP ({dims[0]})"
+    else:
+        grouping = "1"
+    source = ROLLUP_SOURCE if rollup else RAW_SOURCE
+    return TIMESERIES.format(
+        bucket=timeseries_bucket(granularity, rollup),
+        dims="".join(f"{d},\n       " for d in dims),
+        filters="\n  ".join(filters),
+        group_by=grouping,
+        order_by=", ".join(["1", *(f"{d} NULLS FIRST" for d in dims)]),
+        **source
+    )
+
+# Raw sales export, ordered by date. The export runs it once per month, so each query
+# reads one partition and sorts only that month
+EXPORT_COLUMNS = ("id", "sale_date", "product_sku", "region_code", "quantity", "unit_price")
+
+EXPORT_SALES = """
+SELECT s.id,
+       s.sale_date,
+       p.sku AS product_sku,
+       r.code AS region_code,
+       s.quantity,
+       s.unit_price
 FROM sales s
 JOIN products p ON p.id = s.product_id
 JOIN regions  r ON r.id = s.region_id
 WHERE s.sale_date >= %(start)s
   AND s.sale_date <  %(end)s
-  AND (%(region)s = '' OR r.code = %(region)s)
-GROUP BY p.sku, p.name
-ORDER BY total_revenue DESC
-LIMIT %(limit)s;
+  {filters}
+ORDER BY s.sale_date
 """
+
+def export_sales_sql(sku: bool, region: bool) -> str:
+    filters = []
+    if sku:
+        filters.append(PRODUCT_FILTER)
+    if region:
+        filters.append(REGION_FILTER)
+    return EXPORT_SALES.format(filters="\n  ".join(filters))
@@ -0,0 +1,157 @@
+"""
+Background cache warm-up, run on startup and again after every ingest.
+
+The list of reports to warm is made of:
+- the last WARMUP_MONTHS months of monthly-sales and top-products (limit 5), unfiltered
+  and for every region,
+- the reports listed in WARMUP_REPORTS_FILE (a JSON list of ReportSpec objects),
+- the WARMUP_LEARNED reports requested most often recently. They are counted in memory,
+  and kept across restarts in WARMUP_STATE_FILE when that is set.
+
+Reports are computed through the normal handlers by at most WARMUP_CONCURRENCY tasks,
+so warming leaves most of the pool to real traffic.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from collections import Counter
+from datetime import date, timedelta
+from time import perf_counter
+from dotenv import load_dotenv
+from app.models import ReportSpec
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MONTHS = [int(m) for m in os.getenv("WARMUP_MONTHS", "3,6,12").split(",") if m.strip()]
+WARMUP_REPORTS_FILE = os.getenv("WARMUP_REPORTS_FILE")
+WARMUP_LEARNED = int(os.getenv("WARMUP_LEARNED", 20))
+WARMUP_STATE_FILE = os.getenv("WARMUP_STATE_FILE")
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 2))
+
+# Once this many distinct reports are tracked, the counter is cut back to the most common
+TRACKED_MAX = 5000
+
+# "cold" until the first warm-up finishes, "warming" while one runs, then "warm".
+# ready only flips once, re-warming after an ingest does not take the worker out of rotation
+state = {"status": "cold", "ready": False, "total": 0, "done": 0, "failed": 0, "seconds": None}
+
+# Response cache keys of recent report requests -> how often they were asked for
+requested = Counter()
+
+# A warm-up started by an ingest waits for the one still running
+_lock = asyncio.Lock()
+
+def spec_key(spec: ReportSpec) -> tuple:
+    """The response cache key of the report a spec describes."""
+    if spec.report == "monthly-sales":
+        return ("monthly-sales", spec.start_date, spec.end_date, spec.product_sku or "", spec.region_code or "")
+    return ("top-products", spec.start_date, spec.end_date, spec.region_code or "", spec.limit)
+
+def spec_from_key(key: tuple) -> ReportSpec:
+    if key[0] == "monthly-sales":
+        _, start, end, sku, region = key
+        return ReportSpec(report="monthly-sales", start_date=start, end_date=end,
+                          product_sku=sku or None, region_code=region or None)
+    _, start, end, region, limit = key
+    return ReportSpec(report="top-products", start_date=start, end_date=end,
+                      region_code=region or None, limit=limit)
+
+def record(key: tuple):
+    requested[key] += 1
+    if len(requested) > TRACKED_MAX:
+        kept = requested.most_common(TRACKED_MAX // 5)
+        requested.clear()
+        requested.update(dict(kept))
+
+def default_specs(region_codes, today: date = None) -> list:
+    """Monthly sales and top products over the last N months, unfiltered and per region."""
+    today = today or date.today()
+    end = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+    specs = []
+    for months in WARMUP_MONTHS:
+        start = today.replace(day=1)
+        for _ in range(months - 1):
+            start = (start - timedelta(days=1)).replace(day=1)
+        for region in [None, *sorted(region_codes)]:
+            for report in ("monthly-sales", "top-products"):
+                specs.append(ReportSpec(report=report, start_date=start.isoformat(),
+                                        end_date=end.isoformat(), region_code=region))
+    return specs
+
+def file_specs() -> list:
+    """The specs listed in WARMUP_REPORTS_FILE. A bad file or entry is logged and skipped."""
+    if not WARMUP_REPORTS_FILE:
+        return []
+    try:
+        with open(WARMUP_REPORTS_FILE) as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError("expected a JSON list of report specs")
+    except (OSError, ValueError) as exc:
+        logger.error("Ignoring WARMUP_REPORTS_FILE %s: %s", WARMUP_REPORTS_FILE, exc)
+        return []
+    specs = []
+    for entry in entries:
+        try:
+            specs.append(ReportSpec(**entry))
+        except (TypeError, ValueError) as exc:
+            logger.error("Ignoring warm-up spec %r: %s", entry, exc)
+    return specs
+
+def learned_specs() -> list:
+    specs = []
+    for key, _ in requested.most_common(WARMUP_LEARNED):
+        try:
+            specs.append(spec_from_key(key))
+        except (TypeError, ValueError) as exc:
+            logger.error("Ignoring learned warm-up key %r: %s", key, exc)
+    return specs
+
+def warm_specs(region_codes) -> list:
+    """Every report to warm, without duplicates."""
+    specs = default_specs(region_codes) + file_specs() + learned_specs()
+    unique = {}
+    for spec in specs:
+        unique.setdefault(spec_key(spec), spec)
+    return list(unique.values())
+
+async def warm(specs: list, run):
+    """Compute every spec with run(spec), at most WARMUP_CONCURRENCY at a time."""
+    async with _lock:
+        state.update(status="warming", total=len(specs), done=0, failed=0)
+        started = perf_counter()
+        semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
+
+        async def warm_one(spec):
+            async with semaphore:
+                try:
+                    await run(spec)
+                except Exception:
+                    state["failed"] += 1
+                    logger.exception("Warming %s failed", spec_key(spec))
+                finally:
+                    state["done"] += 1
+
+        await asyncio.gather(*(warm_one(spec) for spec in specs))
+        state.update(status="warm", ready=True, seconds=round(perf_counter() - started, 3))
+        logger.info("Warmed %s reports in %.2fs (%s failed)", len(specs), state["seconds"], state["failed"])
+
+def load_learned():
+    if WARMUP_STATE_FILE and os.path.exists(WARMUP_STATE_FILE):
+        try:
+            with open(WARMUP_STATE_FILE) as f:
+                learned = {tuple(key): int(count) for key, count in json.load(f)}
+        except (OSError, ValueError, TypeError) as exc:
+            # Only the learned reports are lost, startup and the default warm-up go on
+            logger.error("Ignoring WARMUP_STATE_FILE %s: %s", WARMUP_STATE_FILE, exc)
+            return
+        requested.update(learned)
+
+def save_learned():
+    if WARMUP_STATE_FILE:
+        with open(WARMUP_STATE_FILE, "w") as f:
+            json.dump(requested.most_common(WARMUP_LEARNED), f)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Load-test the report endpoints against a dataset seeded by benchmarks.seed.
+Each scenario is driven by concurrent clients in-process (ASGI transport, no network)
+and/or over HTTP against uvicorn, with the report caches on and off. Latency
+percentiles and throughput are written as JSON and, given a baseline, regressions
+fail the run with a non-zero exit code.
+Usage:
+    python -m benchmarks.run --mode inprocess --output benchmarks/results/1m.json
+    python -m benchmarks.run --baseline benchmarks/results/1m.json
+"""
+
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from time import perf_counter
+import httpx
+from psycopg import connect
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_URL = os.getenv("BENCH_DATABASE_URL", os.getenv("DATABASE_URL"))
+
+# Dates fall inside the 2024-01..2025-12 range written by benchmarks.seed
+SCENARIOS = {
+    "monthly_sales_year": ("/reports/monthly-sales", {
+        "start_date": "2025-01-01", "end_date": "2026-01-01"}),
+    "monthly_sales_region": ("/reports/monthly-sales", {
+        "start_date": "2025-01-01", "end_date": "2026-01-01", "region_code": "EU"}),
+    "monthly_sales_sku": ("/reports/monthly-sales", {
+        "start_date": "2024-01-01", "end_date": "2026-01-01", "product_sku": "SKU-1"}),
+    "monthly_sales_unaligned": ("/reports/monthly-sales", {
+        "start_date": "2024-03-15", "end_date": "2025-02-20"}),
+    "top_products_year": ("/reports/top-products", {
+        "start_date": "2025-01-01", "end_date": "2026-01-01", "limit": 10}),
+    "top_products_region_unaligned": ("/reports/top-products", {
+        "start_date": "2024-06-10", "end_date": "2024-09-20", "region_code": "AS"}),
+}
+
+UVICORN_STARTUP_SECONDS = 30
+
+async def drive(client, path, params, requests, concurrency, before_request=None):
+    """Send requests from concurrency clients and summarize latency and throughput."""
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            if before_request:
+                before_request()
+            started = perf_counter()
+            try:
+                resp = await client.get(path, params=params)
+                if resp.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((perf_counter() - started) * 1000)
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(quantiles[49], 3),
+        "p95_ms": round(quantiles[94], 3),
+        "p99_ms": round(quantiles[98], 3),
+    }
+
+async def run_scenarios(client, label, args, before_request=None):
+    results = {}
+    for name, (path, params) in SCENARIOS.items():
+        # One untimed request warms the caches (or just the connections when uncached)
+        await client.get(path, params=params)
+        results[f"{label}/{name}"] = stats = await drive(
+            client, path, params, args.requests, args.concurrency, before_request)
+        print(f"  {label}/{name}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+              f"p99 {stats['p99_ms']:.2f} ms, {stats['throughput_rps']:.0f} req/s"
+              + (f", {stats['errors']} errors" if stats["errors"] else ""))
+    return results
+
+async def run_inprocess(args):
+    # Imported here so DATABASE_URL points at the benchmark database first
+    os.environ["DATABASE_URL"] = DB_URL
+    from app.main import app
+    from app import cache
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for cached in args.cache:
+                cache.CACHE_ENABLED = cached == "cached"
+                cache.clear_cache()
+                results.update(await run_scenarios(client, f"inprocess/{cached}", args))
+    return results
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run_uvicorn(args):
+    results = {}
+    for cached in args.cache:
+        port = free_port()
+        env = dict(os.environ, DATABASE_URL=DB_URL,
+                   CACHE_ENABLED="true" if cached == "cached" else "false")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+                await wait_until_healthy(client, server)
+                results.update(await run_scenarios(client, f"uvicorn/{cached}", args))
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+async def wait_until_healthy(client, server):
+    deadline = perf_counter() + UVICORN_STARTUP_SECONDS
+    while perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"uvicorn did not become healthy within {UVICORN_STARTUP_SECONDS}s")
+
+def dataset_rows():
+    with connect(DB_URL) as conn:
+        return conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+
+def compare(report, baseline, tolerance):
+    """Return one message per scenario that got slower or less throughput than baseline allows."""
+    regressions = []
+    if baseline["rows"] != report["rows"]:
+        return [f"baseline has {baseline['rows']} rows, this run has {report['rows']}, "
+                f"seed the same scale before comparing"]
+    for key, base in baseline["results"].items():
+        current = report["results"].get(key)
+        if current is None:
+            continue
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{key}: {current['errors']} errors (baseline {base['errors']})")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {current['p95_ms']:.2f} ms "
+                               f"(baseline {base['p95_ms']:.2f} ms)")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key}: {current['throughput_rps']:.0f} req/s "
+                               f"(baseline {base['throughput_rps']:.0f} req/s)")
+    return regressions
+
+async def main():
+    parser = argparse.ArgumentParser(description='Load-test the report endpoints')
+    parser.add_argument(
+        '--mode', '-m',
+        choices=["inprocess", "uvicorn", "both"],
+        default="both",
+        help='Drive the app in-process, over HTTP against uvicorn, or both (default: both)'
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='+',
+        choices=["cached", "uncached"],
+        default=["cached", "uncached"],
+        help='Run with the report caches on, off, or both (default: both)'
+    )
+    parser.add_argument(
+        '--requests', '-n',
+        type=int,
+        default=500,
+        help='Timed requests per scenario (default: 500)'
+    )
+    parser.add_argument(
+        '--concurrency', '-c',
+        type=int,
+        default=16,
+        help='Concurrent clients per scenario (default: 16)'
+    )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='uvicorn worker processes (default: 1)'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        help='Write the JSON report here, e.g. to save it as a baseline'
+    )
+    parser.add_argument(
+        '--baseline', '-b',
+        help='Compare against a saved JSON report and exit 1 on regression'
+    )
+    parser.add_argument(
+        '--tolerance', '-t',
+        type=float,
+        default=0.25,
+        help='Allowed p95 increase / throughput drop vs baseline as a fraction (default: 0.25)'
+    )
+    args = parser.parse_args()
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "rows": dataset_rows(),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+        },
+        "results": {},
+    }
+    print(f"🚀 Benchmarking against {report['rows']} sales rows...")
+    if args.mode in ("inprocess", "both"):
+        report["results"].update(await run_inprocess(args))
+    if args.mode in ("uvicorn", "both"):
+        report["results"].update(await run_uvicorn(args))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions against {args.baseline}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
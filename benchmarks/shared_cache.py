@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compare per-worker report caches with the shared SQLite backend under uvicorn workers.
+A fixed set of distinct reports is requested several times each, in shuffled order,
+so with per-worker caches most repeats land on a worker that has not computed them
+yet. A request counts as a hit when its Server-Timing header has no sql phase.
+Usage:
+    python -m benchmarks.shared_cache --workers 4 8 --output benchmarks/results/shared.json
+"""
+
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import date, timedelta
+from time import perf_counter
+import httpx
+from benchmarks.run import DB_URL, free_port, wait_until_healthy, dataset_rows
+
+def report_requests(reports: int, repeats: int, seed: int = 7) -> list:
+    """Distinct unaligned top-products and monthly-sales requests, each repeated and shuffled."""
+    rng = random.Random(seed)
+    distinct = []
+    for i in range(reports):
+        start = date(2024, 1, 1) + timedelta(days=rng.randrange(540))
+        end = start + timedelta(days=rng.randrange(20, 150))
+        params = {"start_date": start.isoformat(), "end_date": end.isoformat()}
+        if i % 2:
+            distinct.append(("/reports/monthly-sales", params))
+        else:
+            distinct.append(("/reports/top-products", {**params, "limit": 10}))
+    requests = distinct * repeats
+    rng.shuffle(requests)
+    return requests
+
+async def drive(client, requests: list, concurrency: int) -> dict:
+    latencies = []
+    hits = errors = 0
+    queue = list(requests)
+
+    async def worker():
+        nonlocal hits, errors
+        while queue:
+            path, params = queue.pop()
+            started = perf_counter()
+            try:
+                resp = await client.get(path, params=params)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((perf_counter() - started) * 1000)
+            if resp.status_code != 200:
+                errors += 1
+            elif "sql;" not in resp.headers.get("server-timing", ""):
+                hits += 1
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(requests),
+        "errors": errors,
+        "hit_ratio": round(hits / len(requests), 3),
+        "throughput_rps": round(len(requests) / elapsed, 1),
+        "p50_ms": round(quantiles[49], 3),
+        "p95_ms": round(quantiles[94], 3),
+    }
+
+async def run(backend: str, workers: int, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ, DATABASE_URL=DB_URL, CACHE_ENABLED="true", CACHE_BACKEND=backend,
+            CACHE_SHARED_PATH=os.path.join(tmp, "shared.sqlite3"),
+            # Warm-up would fill the caches with other reports and compete for the database
+            WARMUP_MONTHS="", WARMUP_LEARNED="0",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            timeout = httpx.Timeout(60)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=timeout) as client:
+                await wait_until_healthy(client, server)
+                return await drive(client, report_requests(args.reports, args.repeats), args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare per-worker and shared report caches')
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        nargs='+',
+        default=[4, 8],
+        help='uvicorn worker counts to run (default: 4 8)'
+    )
+    parser.add_argument(
+        '--backend',
+        nargs='+',
+        choices=["memory", "sqlite"],
+        default=["memory", "sqlite"],
+        help='CACHE_BACKEND values to compare (default: both)'
+    )
+    parser.add_argument(
+        '--reports', '-r',
+        type=int,
+        default=40,
+        help='Distinct reports requested (default: 40)'
+    )
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=8,
+        help='Times each report is requested (default: 8)'
+    )
+    parser.add_argument(
+        '--concurrency', '-c',
+        type=int,
+        default=16,
+        help='Concurrent clients (default: 16)'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        help='Write the JSON report here'
+    )
+    args = parser.parse_args()
+
+    report = {"rows": dataset_rows(), "settings": vars(args), "results": {}}
+    print(f"🚀 {args.reports} reports x {args.repeats} against {report['rows']} sales rows...")
+    for workers in args.workers:
+        for backend in args.backend:
+            report["results"][f"{backend}/{workers}"] = stats = await run(backend, workers, args)
+            print(f"  {backend}, {workers} workers: hit ratio {stats['hit_ratio']:.2f}, "
+                  f"p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                  f"{stats['throughput_rps']:.0f} req/s"
+                  + (f", {stats['errors']} errors" if stats["errors"] else ""))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -19,9 +19,28 @@ BEGIN
         );
         EXECUTE ddl;
 
-        -- Added index per partition to speed up queries and cover filters and sorts
-        EXECUTE format('CREATE INDEX IF NOT EXISTS %I_prod_date ON %I (product_id, sale_date);', part_name || '_idx1', part_name);
-        EXECUTE format('CREATE INDEX IF NOT EXISTS %I_region_date ON %I (region_id, sale_date);', part_name || '_idx2', part_name);
-        EXECUTE format('CREATE INDEX IF NOT EXISTS %I_date ON %I (sale_date);', part_name || '_idx3', part_name);
+        PERFORM create_month_partition_indexes(p_month_start);
     END IF;
 END $$;
+
+-- Added index per partition to speed up queries and cover filters and sorts
+-- kept separate so bulk loads can drop them and rebuild after the data lands
+CREATE OR REPLACE FUNCTION create_month_partition_indexes(p_month_start DATE)
+RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    part_name TEXT := 'sales_' || to_char(p_month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I_prod_date ON %I (product_id, sale_date);', part_name || '_idx1', part_name);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I_region_date ON %I (region_id, sale_date);', part_name || '_idx2', part_name);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I_date ON %I (sale_date);', part_name || '_idx3', part_name);
+END $$;
+
+CREATE OR REPLACE FUNCTION drop_month_partition_indexes(p_month_start DATE)
+RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    part_name TEXT := 'sales_' || to_char(p_month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format('DROP INDEX IF EXISTS %I;', part_name || '_idx1_prod_date');
+    EXECUTE format('DROP INDEX IF EXISTS %I;', part_name || '_idx2_region_date');
+    EXECUTE format('DROP INDEX IF EXISTS %I;', part_name || '_idx3_date');
+END $$;
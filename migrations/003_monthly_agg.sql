@@ -0,0 +1,29 @@
+-- Monthly rollup of sales per product and region
+-- the report endpoints only need month level totals, so month-aligned
+-- requests are served from here instead of scanning the raw partitions
+CREATE TABLE IF NOT EXISTS sales_monthly_agg (
+    month DATE NOT NULL,
+    product_id INT NOT NULL REFERENCES products(id),
+    region_id INT NOT NULL REFERENCES regions(id),
+    total_revenue BIGINT NOT NULL,
+    total_quantity BIGINT NOT NULL,
+    PRIMARY KEY (month, product_id, region_id)
+);
+
+-- Rebuild the rollup from the sales fact table
+CREATE OR REPLACE FUNCTION refresh_sales_monthly_agg()
+RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE sales_monthly_agg;
+
+    INSERT INTO sales_monthly_agg (month, product_id, region_id, total_revenue, total_quantity)
+    SELECT date_trunc('month', sale_date)::date,
+           product_id,
+           region_id,
+           SUM(quantity * unit_price),
+           SUM(quantity)
+    FROM sales
+    GROUP BY 1, 2, 3;
+
+    ANALYZE sales_monthly_agg;
+END $$;
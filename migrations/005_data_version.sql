@@ -0,0 +1,15 @@
+-- Single-row counter of completed ingests, the API derives report ETags from it
+-- so clients and proxies can revalidate without re-downloading unchanged reports
+CREATE TABLE IF NOT EXISTS data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Bump the version once an ingest has committed, returning the new value
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS BIGINT LANGUAGE sql AS $$
+    INSERT INTO data_version (id, version) VALUES (TRUE, 1)
+    ON CONFLICT (id) DO UPDATE SET version = data_version.version + 1, updated_at = now()
+    RETURNING version;
+$$;
@@ -0,0 +1,32 @@
+-- One row per completed ingest. Append loads record the months they touched so the
+-- rollup, API caches and anything else derived from sales can refresh only those
+CREATE TABLE IF NOT EXISTS ingest_log (
+    version BIGINT PRIMARY KEY,
+    mode TEXT NOT NULL CHECK (mode IN ('full', 'append')),
+    months DATE[],
+    rows_inserted BIGINT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Rebuild the rollup rows of the given months only, each month is read with a range
+-- predicate so only its partition is scanned
+CREATE OR REPLACE FUNCTION refresh_sales_monthly_agg_months(p_months DATE[])
+RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    m DATE;
+BEGIN
+    FOREACH m IN ARRAY p_months LOOP
+        DELETE FROM sales_monthly_agg WHERE month = m;
+
+        INSERT INTO sales_monthly_agg (month, product_id, region_id, total_revenue, total_quantity)
+        SELECT m,
+               product_id,
+               region_id,
+               SUM(quantity * unit_price),
+               SUM(quantity)
+        FROM sales
+        WHERE sale_date >= m
+          AND sale_date < (m + INTERVAL '1 month')::date
+        GROUP BY 2, 3;
+    END LOOP;
+END $$;
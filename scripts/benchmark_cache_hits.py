@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure cache-hit latency of the report endpoints, in-process against DATABASE_URL.
+Compares serving the cached JSON bytes with rebuilding the response from cached rows.
+Usage: python scripts/benchmark_cache_hits.py --requests 2000
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+from time import perf_counter
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app import cache
+
+ENDPOINTS = [
+    ("/reports/monthly-sales", {"start_date": "2025-01-01", "end_date": "2026-01-01"}),
+    ("/reports/monthly-sales", {"start_date": "2025-01-15", "end_date": "2025-12-15"}),
+    ("/reports/top-products", {"start_date": "2025-01-01", "end_date": "2026-01-01", "limit": 50}),
+]
+
+async def measure(client, path, params, requests, drop_responses):
+    latencies = []
+    for _ in range(requests):
+        if drop_responses:
+            # Only the encoded body is dropped, rows stay cached
+            cache.response_cache.clear()
+        started = perf_counter()
+        resp = await client.get(path, params=params)
+        latencies.append((perf_counter() - started) * 1000)
+        resp.raise_for_status()
+    return latencies
+
+def summarize(latencies):
+    quantiles = statistics.quantiles(latencies, n=100)
+    return f"p50 {quantiles[49]:.3f} ms, p95 {quantiles[94]:.3f} ms, p99 {quantiles[98]:.3f} ms"
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark report cache hits in-process')
+    parser.add_argument(
+        '--requests', '-n',
+        type=int,
+        default=2000,
+        help='Requests per endpoint and mode (default: 2000)'
+    )
+    args = parser.parse_args()
+    
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path, params in ENDPOINTS:
+                # Prime every cache layer before timing hits
+                await client.get(path, params=params)
+                print(f"{path} {params}")
+                for label, drop_responses in [("rows hit", True), ("bytes hit", False)]:
+                    latencies = await measure(client, path, params, args.requests, drop_responses)
+                    print(f"  {label:>9}: {summarize(latencies)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
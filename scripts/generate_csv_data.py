@@ -2,15 +2,29 @@
 """
 Generate CSV data files for products, regions, and sales.
 Usage: python scripts/generate_csv_data.py --products_count 20 --sales_count 5000
+For 10M-100M sales: python scripts/generate_csv_data.py -p 1000 -s 100000000 --vectorized --workers 8 --seed 42
 """
 
 import sys
 import csv
 import random
+import shutil
 import argparse
-from datetime import datetime, timedelta
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
 import os
 
+try:
+    import numpy as np
+except ImportError:  # only needed for --vectorized
+    np = None
+
+SALES_FIELDS = ['sale_date', 'product_id', 'region_id', 'quantity', 'unit_price']
+
+# Day of year when seasonal demand peaks (late June, construction season)
+SEASON_PEAK_DAY = 172
+
 def generate_products(num_products):
     """Generate product data with realistic names."""
     products = []
@@ -93,6 +107,130 @@ def generate_sales(num_sales, products, regions):
     
     return sales
 
+def sales_months(num_sales, start_date, end_date, seasonality):
+    """
+    Split num_sales over the months between start_date and end_date.
+    Each day is weighted by 1 + seasonality * cos(distance to SEASON_PEAK_DAY), so each
+    month gets its share of rows plus the probabilities of its own days.
+    """
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    day_of_year = np.array([d.timetuple().tm_yday for d in days])
+    weights = 1 + seasonality * np.cos(2 * np.pi * (day_of_year - SEASON_PEAK_DAY) / 365.25)
+    weights /= weights.sum()
+    
+    months = {}
+    for d, weight in zip(days, weights):
+        months.setdefault(d.replace(day=1), []).append((d, weight))
+    
+    # Largest remainder keeps the total exact and the split deterministic
+    shares = np.array([sum(w for _, w in month_days) for month_days in months.values()]) * num_sales
+    counts = np.floor(shares).astype(np.int64)
+    for i in np.argsort(counts - shares)[:num_sales - counts.sum()]:
+        counts[i] += 1
+    
+    return [
+        (month, [d for d, _ in month_days], np.array([w for _, w in month_days]) / sum(w for _, w in month_days), int(count))
+        for (month, month_days), count in zip(months.items(), counts)
+    ]
+
+def ascii_digits(values, width):
+    """Right-aligned ASCII digits, unused leading positions are 0 bytes and get dropped."""
+    out = np.zeros((len(values), width), dtype=np.uint8)
+    values = values.copy()
+    for i in range(width - 1, -1, -1):
+        out[:, i] = np.where((values > 0) | (i == width - 1), values % 10 + 48, 0)
+        values //= 10
+    return out
+
+def encode_sales(dates, day, product_id, region_id, quantity, unit_price, widths):
+    """
+    Encode a chunk of sales as CSV bytes without a Python loop per row: every field is
+    written into a fixed-width byte matrix and the padding removed in one pass.
+    """
+    sep = np.full((len(day), 1), ord(','), dtype=np.uint8)
+    rows = np.hstack([
+        dates[day], sep,
+        ascii_digits(product_id, widths[0]), sep,
+        ascii_digits(region_id, widths[1]), sep,
+        ascii_digits(quantity, 3), sep,
+        ascii_digits(unit_price, 4),
+        np.full((len(day), 1), ord('\n'), dtype=np.uint8),
+    ])
+    return rows[rows != 0].tobytes()
+
+def sample(cdf, rng, n):
+    # Inverse CDF sampling, the clip guards against the last cumulative sum rounding below 1
+    return np.minimum(np.searchsorted(cdf, rng.random(n), side='right'), len(cdf) - 1)
+
+def write_month_sales(job):
+    """Write one month of sales in chunks, run in a worker process when sharding."""
+    month_index, days, day_probs, count, products_count, regions_count, zipf, seed, chunk_rows, path = job
+    # One stream per month, so output does not depend on the number of workers
+    rng = np.random.default_rng([seed, month_index])
+    
+    dates = np.frombuffer(b"".join(d.isoformat().encode() for d in days), dtype=np.uint8).reshape(len(days), 10)
+    day_cdf = np.cumsum(day_probs)
+    # Zipf popularity by product id, product 1 is the best seller; zipf=0 is uniform
+    popularity = 1.0 / np.arange(1, products_count + 1) ** zipf
+    product_cdf = np.cumsum(popularity / popularity.sum())
+    widths = (len(str(products_count)), len(str(regions_count)))
+    
+    with open(path, 'wb') as f:
+        f.write((','.join(SALES_FIELDS) + '\n').encode())
+        remaining = count
+        while remaining:
+            n = min(chunk_rows, remaining)
+            f.write(encode_sales(
+                dates,
+                sample(day_cdf, rng, n),
+                sample(product_cdf, rng, n) + 1,
+                rng.integers(1, regions_count + 1, n),
+                rng.integers(1, 101, n),
+                rng.integers(500, 5001, n),
+                widths,
+            ))
+            remaining -= n
+    return path, count
+
+def generate_sales_vectorized(args, products, regions):
+    """Generate sales in NumPy chunks, one file per month, sharded over worker processes."""
+    if np is None:
+        sys.exit("--vectorized requires numpy, install it with `pip install numpy`")
+    
+    end_date = date.fromisoformat(args.end_date) if args.end_date else date.today()
+    start_date = end_date - timedelta(days=args.days)
+    months = sales_months(args.sales_count, start_date, end_date, args.seasonality)
+    
+    out_dir = os.path.join('data', 'sales') if args.per_month else tempfile.mkdtemp(dir='data')
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [
+        (i, days, probs, count, len(products), len(regions), args.zipf, args.seed, args.chunk_rows,
+         os.path.join(out_dir, f"sales_{month:%Y_%m}.csv"))
+        for i, (month, days, probs, count) in enumerate(months)
+    ]
+    
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            written = list(executor.map(write_month_sales, jobs))
+    else:
+        written = [write_month_sales(job) for job in jobs]
+    
+    if args.per_month:
+        for path, count in written:
+            print(f"Generated {path} with {count} rows")
+        return
+    
+    # Stitch the months together in date order, keeping only the first header
+    filepath = os.path.join('data', 'sales.csv')
+    with open(filepath, 'wb') as out:
+        out.write((','.join(SALES_FIELDS) + '\n').encode())
+        for path, _ in written:
+            with open(path, 'rb') as part:
+                part.readline()
+                shutil.copyfileobj(part, out, 16 * 1024 * 1024)
+    shutil.rmtree(out_dir)
+    print(f"Generated {filepath} with {args.sales_count} rows")
+
 def save_csv(data, filename, fieldnames):
     """Save data to CSV file."""
     filepath = os.path.join('data', filename)
@@ -112,6 +250,7 @@ def main():
         python scripts/generate_csv_data.py --products_count 20 --sales_count 5000
         python scripts/generate_csv_data.py -p 50 -s 10000
         python scripts/generate_csv_data.py --products_count 100
+        python scripts/generate_csv_data.py -p 1000 -s 100000000 --vectorized --workers 8 --seed 42 --zipf 1.1 --seasonality 0.5
                 """
             )
     
@@ -129,11 +268,76 @@ def main():
         help='Number of sales records to generate (default: 1000)'
     )
     
+    parser.add_argument(
+        '--vectorized',
+        action='store_true',
+        help='Generate sales in NumPy chunks streamed to disk, for 10M+ rows (requires numpy)'
+    )
+    
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Seed for reproducible output (default: random, printed so the run can be repeated)'
+    )
+    
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='With --vectorized, generate months in this many processes (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--chunk_rows',
+        type=int,
+        default=1_000_000,
+        help='With --vectorized, rows generated and written per chunk (default: 1000000)'
+    )
+    
+    parser.add_argument(
+        '--zipf',
+        type=float,
+        default=0.0,
+        help='With --vectorized, Zipf exponent of product popularity, 0 is uniform (default: 0)'
+    )
+    
+    parser.add_argument(
+        '--seasonality',
+        type=float,
+        default=0.0,
+        help='With --vectorized, amplitude of the yearly demand cycle between 0 and 1 (default: 0)'
+    )
+    
+    parser.add_argument(
+        '--days',
+        type=int,
+        default=180,
+        help='With --vectorized, number of days of sales ending at --end_date (default: 180)'
+    )
+    
+    parser.add_argument(
+        '--end_date',
+        default=None,
+        help='With --vectorized, last sale date as YYYY-MM-DD (default: today)'
+    )
+    
+    parser.add_argument(
+        '--per_month',
+        action='store_true',
+        help='With --vectorized, write data/sales/sales_YYYY_MM.csv per month instead of data/sales.csv'
+    )
+    
     args = parser.parse_args()
     
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(2 ** 32)
+    random.seed(args.seed)
+    
     print(f"Generating CSV data:")
     print(f"  Products: {args.products_count}")
     print(f"  Sales: {args.sales_count}")
+    print(f"  Seed: {args.seed}")
     print()
     
     # Ensure data directory exists
@@ -146,8 +350,11 @@ def main():
     regions = generate_regions()
     save_csv(regions, 'regions.csv', ['id', 'code', 'name'])
     
-    sales = generate_sales(args.sales_count, products, regions)
-    save_csv(sales, 'sales.csv', ['sale_date', 'product_id', 'region_id', 'quantity', 'unit_price'])
+    if args.vectorized:
+        generate_sales_vectorized(args, products, regions)
+    else:
+        sales = generate_sales(args.sales_count, products, regions)
+        save_csv(sales, 'sales.csv', SALES_FIELDS)
     
     print(f"\n All CSV files generated successfully in the data/ folder!")
 
@@ -6,8 +6,12 @@ This ensures proper referential integrity.
 
 import sys
 import os
-import csv
-from psycopg import connect
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import perf_counter
+from psycopg import connect, sql
 from psycopg.rows import dict_row
 from dotenv import load_dotenv
 
@@ -15,6 +19,38 @@ load_dotenv()
 
 DB_URL = os.getenv("DATABASE_URL")
 
+# CSV files are streamed into COPY in chunks of this many bytes, so memory stays
+# flat regardless of file size
+COPY_CHUNK_SIZE = int(os.getenv("INGEST_COPY_CHUNK_BYTES", 1024 * 1024))
+PROGRESS_INTERVAL_SECONDS = 2
+
+def report_throughput(label, rows, nbytes, elapsed):
+    elapsed = max(elapsed, 1e-9)
+    print(f"  {label}: {rows} rows, {nbytes / 1e6:.1f} MB in {elapsed:.2f}s "
+          f"({rows / elapsed:,.0f} rows/s, {nbytes / 1e6 / elapsed:.1f} MB/s)")
+
+def copy_csv(cursor, copy_sql, csv_path):
+    """Stream a CSV file through COPY ... FROM STDIN and return the number of rows copied."""
+    rows_seen = 0
+    bytes_sent = 0
+    started = last_report = perf_counter()
+    
+    with open(csv_path, 'rb') as f, cursor.copy(copy_sql) as copy:
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            copy.write(chunk)
+            bytes_sent += len(chunk)
+            rows_seen += chunk.count(b"\n")
+            
+            now = perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                # rows_seen includes the header line, close enough for progress output
+                report_throughput(f"{csv_path} (in progress)", rows_seen, bytes_sent, now - started)
+                last_report = now
+    
+    rows_copied = cursor.rowcount
+    report_throughput(csv_path, rows_copied, bytes_sent, perf_counter() - started)
+    return rows_copied
+
 def load_products(conn):
     """Load products from CSV into database."""
     with conn.cursor() as cursor:
@@ -23,17 +59,10 @@ def load_products(conn):
         # Clear existing products
         cursor.execute("TRUNCATE products RESTART IDENTITY CASCADE")
         
-        csv_path = "data/products.csv"
-        products_loaded = 0
-        
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                cursor.execute("""
-                    INSERT INTO products (id, sku, name)
-                    VALUES (%s, %s, %s)
-                """, (row['id'], row['sku'], row['name']))
-                products_loaded += 1
+        products_loaded = copy_csv(cursor, """
+            COPY products (id, sku, name)
+            FROM STDIN WITH (FORMAT csv, HEADER MATCH)
+        """, "data/products.csv")
         
         print(f"Loaded {products_loaded} products")
         return products_loaded
@@ -46,22 +75,108 @@ def load_regions(conn):
         # Clear existing regions
         cursor.execute("TRUNCATE regions RESTART IDENTITY CASCADE")
         
-        csv_path = "data/regions.csv"
-        regions_loaded = 0
-        
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                cursor.execute("""
-                    INSERT INTO regions (id, code, name)
-                    VALUES (%s, %s, %s)
-                """, (row['id'], row['code'], row['name']))
-                regions_loaded += 1
+        regions_loaded = copy_csv(cursor, """
+            COPY regions (id, code, name)
+            FROM STDIN WITH (FORMAT csv, HEADER MATCH)
+        """, "data/regions.csv")
         
         print(f"Loaded {regions_loaded} regions")
         return regions_loaded
 
-def load_sales(conn):
+SALES_GOOD_SELECT = """
+SELECT g.sale_date,
+       p.id,
+       r.id,
+       g.quantity,
+       g.unit_price
+FROM sales_good g
+JOIN products p ON p.id = g.product_id
+JOIN regions r ON r.id = g.region_id
+"""
+
+def load_partition(month):
+    """Load one month from sales_good into its partition on a dedicated connection."""
+    next_month = (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+    partition = sql.Identifier(f"sales_{month:%Y_%m}")
+    
+    with connect(DB_URL, autocommit=True) as conn:
+        # Secondary indexes are cheaper to build once than to maintain row by row
+        conn.execute("SELECT drop_month_partition_indexes(%s)", (month,))
+        
+        started = perf_counter()
+        cursor = conn.execute(sql.SQL("""
+            INSERT INTO {} (sale_date, product_id, region_id, quantity, unit_price)
+            {} WHERE g.sale_date >= %s AND g.sale_date < %s
+        """).format(partition, sql.SQL(SALES_GOOD_SELECT)), (month, next_month))
+        rows = cursor.rowcount
+        loaded = perf_counter()
+        
+        conn.execute("SELECT create_month_partition_indexes(%s)", (month,))
+        # VACUUM sets the visibility map, without it index-only scans still visit the heap
+        conn.execute(sql.SQL("VACUUM (ANALYZE) {}").format(partition))
+        indexed = perf_counter()
+    
+    return month, rows, loaded - started, indexed - loaded
+
+def load_partitions_parallel(months, workers):
+    """Fan the per-month loads out over a pool of worker connections."""
+    print(f"Loading {len(months)} partitions with {workers} workers...")
+    started = perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for month, rows, load_s, index_s in executor.map(load_partition, months):
+            print(f"  sales_{month:%Y_%m}: {rows} rows, load {load_s:.2f}s, "
+                  f"index {index_s:.2f}s")
+    
+    print(f"Loaded all partitions in {perf_counter() - started:.2f}s")
+
+def stage_sales(cursor, csv_path):
+    """COPY a sales CSV into sales_stage and keep its valid rows in sales_good."""
+    # Create staging table, unlogged since it is rebuilt on every run
+    cursor.execute("""
+        DROP TABLE IF EXISTS sales_stage;
+        CREATE UNLOGGED TABLE sales_stage (
+            sale_date TEXT,
+            product_id TEXT,
+            region_id TEXT,
+            quantity TEXT,
+            unit_price TEXT
+        );
+    """)
+    
+    # Stream CSV into staging, empty fields arrive as NULL and are rejected by validation
+    rows_inserted = copy_csv(cursor, """
+        COPY sales_stage (sale_date, product_id, region_id, quantity, unit_price)
+        FROM STDIN WITH (FORMAT csv, HEADER MATCH)
+    """, csv_path)
+    
+    print(f"Loaded {rows_inserted} rows into staging table")
+    
+    # Keep valid rows in an unlogged table so partition workers on other
+    # connections can read them (a TEMP table is only visible to this session)
+    cursor.execute("""
+        DROP TABLE IF EXISTS sales_good;
+        CREATE UNLOGGED TABLE sales_good AS
+        WITH cleaned AS (
+          SELECT
+            to_date(sale_date, 'YYYY-MM-DD') AS sale_date,
+            (NULLIF(product_id, ''))::INT AS product_id,
+            (NULLIF(region_id, ''))::INT AS region_id,
+            quantity::INT AS quantity,
+            unit_price::INT AS unit_price
+          FROM sales_stage
+        )
+        SELECT *
+        FROM cleaned
+        WHERE sale_date IS NOT NULL
+          AND product_id IS NOT NULL
+          AND region_id IS NOT NULL
+          AND quantity > 0
+          AND unit_price >= 0;
+    """)
+    return rows_inserted
+
+def load_sales(conn, workers=1):
     """Load sales from CSV into database."""
     with conn.cursor() as cursor:
         print("Loading sales...")
@@ -69,82 +184,34 @@ def load_sales(conn):
         # Clear existing sales
         cursor.execute("TRUNCATE sales RESTART IDENTITY CASCADE")
         
-        # Create staging table
-        cursor.execute("""
-            DROP TABLE IF EXISTS sales_stage;
-            CREATE TABLE sales_stage (
-                sale_date TEXT,
-                product_id TEXT,
-                region_id TEXT,
-                quantity TEXT,
-                unit_price TEXT
-            );
-        """)
-        
-        # Load CSV into staging
-        csv_path = "data/sales.csv"
-        rows_inserted = 0
-        
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                cursor.execute("""
-                    INSERT INTO sales_stage (sale_date, product_id, region_id, quantity, unit_price)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (row['sale_date'], row['product_id'], row['region_id'], row['quantity'], row['unit_price']))
-                rows_inserted += 1
-        
-        print(f"Loaded {rows_inserted} rows into staging table")
+        stage_sales(cursor, "data/sales.csv")
         
         # Validate and insert into sales
         print("Validating and inserting into sales...")
         
-        # Create temporary table for valid rows
+        # Make sure partitions exist for each month, biggest months first so
+        # the parallel loader hands out the longest jobs early
         cursor.execute("""
-            CREATE TEMP TABLE good_tmp AS
-            WITH cleaned AS (
-              SELECT
-                to_date(sale_date, 'YYYY-MM-DD') AS sale_date,
-                (NULLIF(product_id, ''))::INT AS product_id,
-                (NULLIF(region_id, ''))::INT AS region_id,
-                quantity::INT AS quantity,
-                unit_price::INT AS unit_price
-              FROM sales_stage
-            )
-            SELECT *
-            FROM cleaned
-            WHERE sale_date IS NOT NULL
-              AND product_id IS NOT NULL
-              AND region_id IS NOT NULL
-              AND quantity > 0
-              AND unit_price >= 0;
+            SELECT date_trunc('month', sale_date)::date AS month, COUNT(*) AS cnt
+            FROM sales_good
+            GROUP BY 1
+            ORDER BY 2 DESC
         """)
+        months = [row["month"] for row in cursor.fetchall()]
+        for month in months:
+            cursor.execute("SELECT create_month_partition(%s)", (month,))
         
-        # Make sure partitions exist for each month
-        cursor.execute("""
-            DO $$
-            DECLARE m_start DATE;
-            BEGIN
-              FOR m_start IN
-                SELECT date_trunc('month', sale_date)::date FROM good_tmp GROUP BY 1
-              LOOP
-                PERFORM create_month_partition(m_start);
-              END LOOP;
-            END $$;
-        """)
+        if workers > 1:
+            load_partitions_parallel(months, workers)
+        else:
+            # Insert valid rows into sales
+            cursor.execute(f"""
+                INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
+                {SALES_GOOD_SELECT};
+            """)
+            cursor.execute("VACUUM (ANALYZE) sales")
         
-        # Insert valid rows into sales
-        cursor.execute("""
-            INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
-            SELECT g.sale_date,
-                   p.id,
-                   r.id,
-                   g.quantity,
-                   g.unit_price
-            FROM good_tmp g
-            JOIN products p ON p.id = g.product_id
-            JOIN regions r ON r.id = g.region_id;
-        """)
+        cursor.execute("DROP TABLE sales_good")
         
         # Get final counts
         cursor.execute("SELECT COUNT(*) as cnt FROM sales")
@@ -153,12 +220,128 @@ def load_sales(conn):
         cursor.execute("SELECT COUNT(*) as cnt FROM sales_stage")
         staging_count = cursor.fetchone()["cnt"]
         
-        print(f"Inserted {sales_count} sales records from {staging_count} staging rows")
+        print(f"Inserted {sales_count} sales records from {staging_count} staging rows "
+              f"({staging_count - sales_count} rejected)")
         return sales_count
 
+# Rows are told apart by their fields plus how often that exact row occurs in the delta,
+# and the n-th copy is only inserted if sales holds fewer than n copies. Re-running the
+# same delta inserts nothing, without keeping a dedup key per row. Existing copies are
+# counted through the covering (product_id, sale_date) partition indexes
+APPEND_SALES = """
+WITH delta AS (
+    SELECT g.sale_date, p.id AS product_id, r.id AS region_id, g.quantity, g.unit_price,
+           row_number() OVER (
+               PARTITION BY g.sale_date, p.id, r.id, g.quantity, g.unit_price
+           ) AS occurrence
+    FROM sales_good g
+    JOIN products p ON p.id = g.product_id
+    JOIN regions r ON r.id = g.region_id
+),
+existing AS (
+    SELECT s.sale_date, s.product_id, s.region_id, s.quantity, s.unit_price, COUNT(*) AS copies
+    FROM sales s
+    JOIN (SELECT DISTINCT sale_date, product_id FROM sales_good) k
+      ON k.sale_date = s.sale_date AND k.product_id = s.product_id
+    WHERE s.sale_date >= (SELECT MIN(sale_date) FROM sales_good)
+      AND s.sale_date <= (SELECT MAX(sale_date) FROM sales_good)
+    GROUP BY 1, 2, 3, 4, 5
+),
+inserted AS (
+    INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
+    SELECT d.sale_date, d.product_id, d.region_id, d.quantity, d.unit_price
+    FROM delta d
+    LEFT JOIN existing e USING (sale_date, product_id, region_id, quantity, unit_price)
+    WHERE d.occurrence > COALESCE(e.copies, 0)
+    RETURNING sale_date
+)
+SELECT date_trunc('month', sale_date)::date AS month, COUNT(*) AS cnt
+FROM inserted
+GROUP BY 1
+ORDER BY 1
+"""
+
+def append_sales(conn, csv_path):
+    """Insert the rows of a delta CSV that are not loaded yet, returning {month: rows inserted}."""
+    with conn.cursor() as cursor:
+        print(f"Appending sales from {csv_path}...")
+        stage_sales(cursor, csv_path)
+        
+        # create_month_partition is a no-op for months that already have one
+        cursor.execute("SELECT DISTINCT date_trunc('month', sale_date)::date AS month FROM sales_good")
+        for row in cursor.fetchall():
+            cursor.execute("SELECT create_month_partition(%s)", (row["month"],))
+        
+        # Insert, rollup refresh and notification commit together, NOTIFY is sent on commit
+        with conn.transaction():
+            # Two appends counting existing copies at the same time could both insert a row
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('sales_append'))")
+            cursor.execute(APPEND_SALES)
+            changed = {row["month"]: row["cnt"] for row in cursor.fetchall()}
+            if changed:
+                cursor.execute("SELECT refresh_sales_monthly_agg_months(%s)", (sorted(changed),))
+                notify_ingest(conn, mode="append", months=sorted(changed), rows=sum(changed.values()))
+        
+        # Keep the visibility map current for index-only scans on the touched partitions
+        for month in changed:
+            cursor.execute(sql.SQL("VACUUM (ANALYZE) {}").format(sql.Identifier(f"sales_{month:%Y_%m}")))
+        
+        cursor.execute("SELECT COUNT(*) as cnt FROM sales_good")
+        valid_count = cursor.fetchone()["cnt"]
+        cursor.execute("DROP TABLE sales_good")
+        
+        inserted = sum(changed.values())
+        for month, rows in changed.items():
+            print(f"  {month:%Y-%m}: {rows} new rows")
+        print(f"Inserted {inserted} new sales records into {len(changed)} months "
+              f"({valid_count - inserted} valid rows were already loaded)")
+        return changed
+
+def refresh_monthly_agg(conn):
+    """Rebuild the month x product x region rollup used by the report endpoints."""
+    with conn.cursor() as cursor:
+        print("Refreshing monthly rollup...")
+        cursor.execute("SELECT refresh_sales_monthly_agg()")
+        
+        cursor.execute("SELECT COUNT(*) as cnt FROM sales_monthly_agg")
+        agg_count = cursor.fetchone()["cnt"]
+        
+        print(f"Rolled up into {agg_count} month/product/region rows")
+        return agg_count
+
+def notify_ingest(conn, mode="full", months=None, rows=0):
+    """
+    Bump the data version, log the ingest and tell running API workers (listening on
+    sales_ingested) to drop cached reports. Appends name their months in the payload so
+    workers only drop what overlaps them, an empty payload means everything changed.
+    """
+    version = conn.execute("SELECT bump_data_version() AS version").fetchone()["version"]
+    conn.execute("""
+        INSERT INTO ingest_log (version, mode, months, rows_inserted) VALUES (%s, %s, %s, %s)
+    """, (version, mode, months, rows))
+    payload = json.dumps({"version": version, "months": [m.isoformat() for m in months]}) if months else ""
+    conn.execute("SELECT pg_notify('sales_ingested', %s)", (payload,))
+    print(f"Data version is now {version}")
+
 def main():
     """Main ingestion process."""
-    print("🚀 Starting complete data ingestion...")
+    parser = argparse.ArgumentParser(description='Ingest CSV data from the data/ folder')
+    parser.add_argument(
+        '--append', '-a',
+        metavar='CSV',
+        help='Only add the sales in this delta CSV (same columns as data/sales.csv), '
+             'skipping rows already loaded and refreshing just the months it touches'
+    )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='Load sales partitions concurrently over this many connections, '
+             'building each partition\'s indexes after its data lands (default: 1)'
+    )
+    args = parser.parse_args()
+    
+    print("🚀 Starting append ingestion..." if args.append else "🚀 Starting complete data ingestion...")
     
     with connect(DB_URL, row_factory=dict_row, autocommit=True) as conn:
         print("Running migrations...")
@@ -166,17 +349,36 @@ def main():
             conn.execute(f.read())
         with open("migrations/002_helpers.sql") as f:
             conn.execute(f.read())
+        with open("migrations/003_monthly_agg.sql") as f:
+            conn.execute(f.read())
+        with open("migrations/004_covering_indexes.sql") as f:
+            conn.execute(f.read())
+        with open("migrations/005_data_version.sql") as f:
+            conn.execute(f.read())
+        with open("migrations/006_append_ingest.sql") as f:
+            conn.execute(f.read())
+        
+        if args.append:
+            changed = append_sales(conn, args.append)
+            print("\n📊 Append Summary:")
+            print(f"  Months changed: {', '.join(f'{m:%Y-%m}' for m in changed) or 'none'}")
+            print(f"  Sales added: {sum(changed.values())}")
+            print("🎉 Append finished!")
+            return
         
         # Load in order: products -> regions -> sales
         products_count = load_products(conn)
         regions_count = load_regions(conn)
-        sales_count = load_sales(conn)
+        sales_count = load_sales(conn, workers=args.workers)
+        agg_count = refresh_monthly_agg(conn)
+        notify_ingest(conn, rows=sales_count)
         
         # Final summary
         print("\n📊 Ingestion Summary:")
         print(f"  Products: {products_count}")
         print(f"  Regions: {regions_count}")
         print(f"  Sales: {sales_count}")
+        print(f"  Monthly rollup rows: {agg_count}")
         print("🎉 Complete ingestion finished!")
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Move existing sales partitions to the covering + BRIN index set from migration 004.
+Each partition gets the new indexes built before its old ones are dropped, then a
+VACUUM so the visibility map allows index-only scans straight away.
+Usage: python scripts/reindex_partitions.py
+"""
+
+import os
+from time import perf_counter
+from psycopg import connect, sql
+from psycopg.rows import dict_row
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_URL = os.getenv("DATABASE_URL")
+
+def list_partitions(conn):
+    """Return (partition name, month start) for every sales partition, oldest first."""
+    return conn.execute("""
+        SELECT c.relname AS name,
+               to_date(substring(c.relname FROM 'sales_(\\d{4}_\\d{2})'), 'YYYY_MM') AS month
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sales'::regclass
+        ORDER BY 2
+    """).fetchall()
+
+def index_size(conn, partition):
+    return conn.execute("""
+        SELECT COALESCE(SUM(pg_relation_size(indexrelid)), 0)::bigint AS size
+        FROM pg_index WHERE indrelid = %s::regclass
+    """, (partition,)).fetchone()["size"]
+
+def main():
+    """Reindex every sales partition."""
+    print("🚀 Reindexing sales partitions...")
+
+    with connect(DB_URL, row_factory=dict_row, autocommit=True) as conn:
+        print("Running migrations...")
+        with open("migrations/004_covering_indexes.sql") as f:
+            conn.execute(f.read())
+
+        partitions = list_partitions(conn)
+        before_total = after_total = 0
+        for partition in partitions:
+            name, month = partition["name"], partition["month"]
+            started = perf_counter()
+            before = index_size(conn, name)
+
+            # Reads keep being served from the old indexes until the new ones exist,
+            # CREATE INDEX only blocks writes to this one partition
+            conn.execute("SELECT create_month_partition_indexes(%s)", (month,))
+            conn.execute("SELECT drop_legacy_month_partition_indexes(%s)", (month,))
+            conn.execute(sql.SQL("VACUUM (ANALYZE) {}").format(sql.Identifier(name)))
+
+            after = index_size(conn, name)
+            before_total += before
+            after_total += after
+            print(f"  {name}: indexes {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+                  f"in {perf_counter() - started:.2f}s")
+
+        print(f"🎉 Reindexed {len(partitions)} partitions, "
+              f"indexes {before_total / 1e6:.1f} MB -> {after_total / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
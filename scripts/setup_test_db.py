@@ -47,6 +47,14 @@ def run_migrations():
                 conn.execute(f.read())
             with open("migrations/002_helpers.sql", "r") as f:
                 conn.execute(f.read())
+            with open("migrations/003_monthly_agg.sql", "r") as f:
+                conn.execute(f.read())
+            with open("migrations/004_covering_indexes.sql", "r") as f:
+                conn.execute(f.read())
+            with open("migrations/005_data_version.sql", "r") as f:
+                conn.execute(f.read())
+            with open("migrations/006_append_ingest.sql", "r") as f:
+                conn.execute(f.read())
         print("Migrations completed successfully")
         return True
     except Exception as e:
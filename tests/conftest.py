@@ -21,6 +21,11 @@ print(f"Base DB URL: {BASE_DB_URL}")
 # Test database connection string
 TEST_DB_URL = f"postgresql://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}/{TEST_DB_NAME}"
 
+# Point the app's pool at the test database before app.db is imported
+os.environ["DATABASE_URL"] = TEST_DB_URL
+# Warm-ups triggered by one test's NOTIFY must not replay another test's requests
+os.environ["WARMUP_LEARNED"] = "0"
+
 def create_test_database():
     """Create a temporary test database"""
     try:
@@ -59,6 +64,14 @@ def run_migrations():
                 conn.execute(f.read())
             with open("migrations/002_helpers.sql", "r") as f:
                 conn.execute(f.read())
+            with open("migrations/003_monthly_agg.sql", "r") as f:
+                conn.execute(f.read())
+            with open("migrations/004_covering_indexes.sql", "r") as f:
+                conn.execute(f.read())
+            with open("migrations/005_data_version.sql", "r") as f:
+                conn.execute(f.read())
+            with open("migrations/006_append_ingest.sql", "r") as f:
+                conn.execute(f.read())
         print("Migrations completed successfully")
     except Exception as e:
         print(f"Error running migrations: {e}")
@@ -105,3 +118,30 @@ def clean_db(test_db):
             conn.execute(f"TRUNCATE TABLE {', '.join(tables)} RESTART IDENTITY CASCADE")
         
         yield test_db
+
+@pytest.fixture(scope="session")
+def app_client(test_db):
+    """Fixture running the FastAPI app (and its connection pool) for the whole session"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    # The async pool cannot be reopened once closed, so share one client
+    with TestClient(app) as client:
+        # Let the startup warm-up finish so it cannot fill caches in the middle of a test
+        while not client.get("/health").json()["warmup"]["ready"]:
+            time.sleep(0.01)
+        yield client
+
+@pytest.fixture
+def client(app_client, clean_db):
+    """Fixture providing an API client with empty tables and an empty report cache"""
+    from app.cache import clear_cache
+    clear_cache()
+    yield app_client
+
+@pytest.fixture
+def reload_dimensions(app_client):
+    """Fixture returning a callable that reloads the app's product/region snapshot after seeding"""
+    from app import dimensions
+    from app.db import pool
+    return lambda: app_client.portal.call(dimensions.reload, pool)
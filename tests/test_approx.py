@@ -0,0 +1,83 @@
+from datetime import date
+from psycopg import connect
+from psycopg.rows import dict_row
+from app import approx
+from app.sql import reports
+
+def seed_spread(conn):
+    # 40k sales over June and July, 20 products in 2 regions, varied quantity and price
+    conn.execute("TRUNCATE sales, products, regions RESTART IDENTITY CASCADE")
+    conn.execute("SELECT create_month_partition('2025-06-01'::date)")
+    conn.execute("SELECT create_month_partition('2025-07-01'::date)")
+    conn.execute("INSERT INTO products (sku, name) SELECT 'P' || i, 'P' || i FROM generate_series(1, 20) i")
+    conn.execute("INSERT INTO regions (code, name) VALUES ('US', 'US'), ('EU', 'EU')")
+    conn.execute("""
+      INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
+      SELECT '2025-06-01'::date + (i % 61), 1 + i % 20, 1 + i % 2, 1 + i * 7 % 9, 5 + i * 13 % 50
+      FROM generate_series(0, 39999) i;
+    """)
+    conn.execute("VACUUM (ANALYZE) sales")
+
+def test_sample_intervals_cover_exact_totals(clean_db):
+    with connect(clean_db, row_factory=dict_row, autocommit=True) as conn:
+        seed_spread(conn)
+        params = {"start": "2025-06-03", "end": "2025-07-29"}
+        exact = {r["month"]: r for r in conn.execute(reports.monthly_sales_sql(), params).fetchall()}
+
+        # 40 samples x 2 months x 2 totals, a 95% interval should miss about 8 times
+        covered = total = 0
+        for seed in range(40):
+            sampled = conn.execute(reports.monthly_sales_sample_sql(), {**params, "percent": 5, "seed": seed}).fetchall()
+            for row in approx.scale_rows(sampled, 5):
+                for column in ("total_revenue", "total_quantity"):
+                    low, high = row[f"{column}_ci"]
+                    truth = exact[row["month"]][column]
+                    covered += low <= truth <= high
+                    total += 1
+                    # ~950 sampled rows per month, a relative standard error of about 4%
+                    assert abs(row[column] - truth) / truth < 0.15
+        assert total == 160
+        assert covered / total >= 0.85
+
+def test_sample_rate_follows_partition_estimates(clean_db, monkeypatch):
+    with connect(clean_db, row_factory=dict_row, autocommit=True) as conn:
+        seed_spread(conn)
+        partitions = conn.execute(reports.PARTITION_ROWS).fetchall()
+    rows = approx.estimated_rows(partitions, date(2025, 6, 1), date(2025, 6, 16))
+    assert abs(rows - 40000 * 30 / 61 * 15 / 30) < 500
+
+    monkeypatch.setattr(approx, "APPROX_SAMPLE_ROWS", 2000)
+    assert approx.sample_percent(40000) == 5.0
+    # sampling most of the rows would not pay off
+    assert approx.sample_percent(4000) is None
+    assert approx.sample_percent(0) is None
+
+def test_approx_reports(client, db_connection, reload_dimensions, monkeypatch):
+    seed_spread(db_connection)
+    reload_dimensions()
+    monkeypatch.setattr(approx, "APPROX_SAMPLE_ROWS", 2000)
+    params = {"start_date": "2025-06-03", "end_date": "2025-07-29"}
+
+    exact = client.get("/reports/monthly-sales", params=params).json()
+    assert set(exact) == {"rows"} and set(exact["rows"][0]) == {"month", "total_revenue", "total_quantity"}
+
+    resp = client.get("/reports/monthly-sales", params={**params, "accuracy": "approx"}).json()
+    assert resp["approximate"] is True
+    assert 0 < resp["sample_percent"] < 10
+    for row, truth in zip(resp["rows"], exact["rows"]):
+        assert row["month"] == truth["month"]
+        low, high = row["total_revenue_ci"]
+        assert low <= truth["total_revenue"] <= high
+        assert abs(row["total_revenue"] - truth["total_revenue"]) / truth["total_revenue"] < 0.1
+
+    top = client.get("/reports/top-products", params={**params, "limit": 3, "accuracy": "approx"}).json()
+    assert top["approximate"] is True
+    assert len(top["rows"]) == 3
+    assert all(row["product_sku"].startswith("P") and len(row["total_quantity_ci"]) == 2 for row in top["rows"])
+
+    # month-aligned ranges come from the rollup, which is exact and cheaper than sampling
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    aligned = {"start_date": "2025-06-01", "end_date": "2025-08-01"}
+    resp = client.get("/reports/monthly-sales", params={**aligned, "accuracy": "approx"}).json()
+    assert resp["approximate"] is False
+    assert resp["rows"] == client.get("/reports/monthly-sales", params=aligned).json()["rows"]
@@ -0,0 +1,248 @@
+import asyncio
+from app import cache
+
+def test_concurrent_misses_share_one_query(monkeypatch):
+    monkeypatch.setattr(cache, "report_cache", {})
+    monkeypatch.setattr(cache, "cache_stats", dict.fromkeys(cache.cache_stats, 0))
+    calls = 0
+
+    @cache.cached_report
+    async def slow_query(*, sql, params):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return [{"sql": sql}]
+
+    async def burst():
+        return await asyncio.gather(*(slow_query(sql="q", params={"a": 1}) for _ in range(10)))
+
+    results = asyncio.run(burst())
+    assert calls == 1
+    assert all(r == [{"sql": "q"}] for r in results)
+    assert cache.cache_stats["misses"] == 1
+    assert cache.cache_stats["coalesced"] == 9
+
+    asyncio.run(slow_query(sql="q", params={"a": 1}))
+    assert calls == 1
+    assert cache.cache_stats["hits"] == 1
+
+def test_stale_entry_served_while_refreshing(monkeypatch):
+    monkeypatch.setattr(cache, "report_cache", {})
+    calls = 0
+
+    @cache.cached_report
+    async def query(*, sql, params):
+        nonlocal calls
+        calls += 1
+        return calls
+
+    async def scenario():
+        assert await query(sql="q", params={}) == 1
+        # age the entry past CACHE_TTL, it should still be served once and refreshed behind it
+        key = next(iter(cache.report_cache))
+        cache.report_cache[key] = (1, cache.monotonic() - cache.CACHE_TTL - 1)
+        assert await query(sql="q", params={}) == 1
+        await asyncio.sleep(0)
+        assert await query(sql="q", params={}) == 2
+
+    asyncio.run(scenario())
+    assert calls == 2
+
+def test_invalidate_months_drops_only_overlapping_entries(monkeypatch):
+    from datetime import date
+    monkeypatch.setattr(cache, "report_cache", {})
+    monkeypatch.setattr(cache, "month_cache", {})
+    monkeypatch.setattr(cache, "response_cache", {})
+
+    cache.month_cache[(date(2025, 6, 1), "", "")] = ({"month": "2025-06"}, None)
+    cache.month_cache[(date(2025, 5, 1), "", "")] = ({"month": "2025-05"}, None)
+    cache.report_cache[cache.report_key("q", {"start": "2025-05-10", "end": "2025-06-02"})] = ([], 0)
+    cache.report_cache[cache.report_key("q", {"start": "2025-07-01", "end": "2025-08-01"})] = ([], 0)
+    cache.response_cache[("monthly-sales", "2025-06-01", "2025-07-01", "", "")] = b"june"
+    cache.response_cache[("top-products", "2025-01-01", "2025-06-01", "", 5)] = b"before june"
+
+    assert cache.invalidate_months(["2025-06-01"]) == 3
+    assert list(cache.month_cache) == [(date(2025, 5, 1), "", "")]
+    assert [dict(key[1])["start"] for key in cache.report_cache] == ["2025-07-01"]
+    assert list(cache.response_cache) == [("top-products", "2025-01-01", "2025-06-01", "", 5)]
+
+def test_caches_are_sized_in_bytes_and_compress_large_entries(monkeypatch):
+    from cachetools import TTLCache
+    monkeypatch.setattr(cache, "response_cache", TTLCache(maxsize=10_000, ttl=60, getsizeof=cache.sizeof))
+    monkeypatch.setattr(cache, "CACHE_COMPRESS_MIN_BYTES", 0)
+
+    # a few small bodies fit, one large body evicts the least recently used ones
+    for i in range(4):
+        cache.put_response(("r", i), b"x" * 1000)
+    cache.get_response(("r", 0))
+    cache.put_response(("big", 0), b"y" * 6000)
+    assert set(cache.response_cache) == {("r", 0), ("r", 2), ("r", 3), ("big", 0)}
+    assert cache.response_cache.currsize <= 10_000
+    # a value larger than the whole budget is simply not cached
+    cache.put_response(("huge", 0), b"z" * 20_000)
+    assert ("huge", 0) not in cache.response_cache
+
+    # compressed entries cost their compressed size and come back unchanged
+    monkeypatch.setattr(cache, "CACHE_COMPRESS_MIN_BYTES", 4096)
+    rows = [{"month": f"2025-{m:02d}", "total_revenue": m * 1000, "total_quantity": m} for m in range(1, 13)] * 20
+    packed = cache.pack(rows)
+    assert isinstance(packed, cache.Compressed)
+    assert cache.sizeof(packed) < cache.sizeof(rows) / 10
+    assert cache.unpack(packed) == rows
+    body = b'{"rows":[' + b'{"month":"2025-06","total_revenue":300},' * 200 + b']}'
+    cache.put_response(("big", 1), body)
+    assert isinstance(cache.response_cache[("big", 1)], cache.Compressed)
+    assert cache.get_response(("big", 1)) == body
+
+def test_top_keys_leave_lru_order_alone(monkeypatch):
+    from cachetools import LRUCache
+    month_cache = LRUCache(maxsize=3000, getsizeof=cache.sizeof)
+    monkeypatch.setattr(cache, "month_cache", month_cache)
+    monkeypatch.setattr(cache, "report_cache", LRUCache(maxsize=10, getsizeof=cache.sizeof))
+    monkeypatch.setattr(cache, "response_cache", LRUCache(maxsize=10, getsizeof=cache.sizeof))
+    for i in range(3):
+        month_cache[i] = b"x" * (200 + 100 * i)
+    month_cache[0]
+
+    top = cache.top_keys(2)
+    assert [(name, key) for name, key, _ in top] == [("month", 2), ("month", 1)]
+    assert sum(size for _, _, size in cache.top_keys()) == month_cache.currsize
+    # listing did not refresh keys 1 and 2, so 1 is still the least recently used
+    month_cache[3] = b"x" * 2000
+    assert set(month_cache) == {0, 2, 3}
+
+def test_entry_sizes_without_cachetools_internals():
+    from cachetools import LRUCache
+    # entry_sizes reads this private attribute, a cachetools upgrade that drops it should be noticed
+    for name, held in cache.caches().items():
+        assert isinstance(getattr(held, "_Cache__size", None), dict), f"{name} cache lost cachetools' _Cache__size"
+
+    month_cache = LRUCache(maxsize=3000, getsizeof=cache.sizeof)
+    for i in range(3):
+        month_cache[i] = b"x" * (200 + 100 * i)
+    month_cache[0]
+    # the way a cachetools release without the attribute would look
+    accounted = vars(month_cache).pop("_Cache__size")
+    try:
+        assert cache.entry_sizes(month_cache) == accounted
+    finally:
+        month_cache._Cache__size = accounted
+    # measuring the values did not refresh them either, so 1 is still the least recently used
+    month_cache[3] = b"x" * 2000
+    assert set(month_cache) == {0, 2, 3}
+
+def test_invalidate_by_report_and_range(monkeypatch):
+    from datetime import date
+    monkeypatch.setattr(cache, "report_cache", {})
+    monkeypatch.setattr(cache, "month_cache", {})
+    monkeypatch.setattr(cache, "response_cache", {})
+
+    cache.month_cache[(date(2025, 6, 1), "", "")] = ({"month": "2025-06"}, None)
+    cache.report_cache[cache.report_key("q", {"start": "2025-06-10", "end": "2025-06-20"})] = ([], 0)
+    cache.response_cache[("monthly-sales", "2025-06-01", "2025-07-01", "", "")] = b"monthly june"
+    cache.response_cache[("top-products", "2025-06-01", "2025-07-01", "", 5)] = b"top june"
+    cache.response_cache[("top-products", "2025-01-01", "2025-02-01", "", 5)] = b"top january"
+
+    # report only: its responses go, rows under it go since they are not tagged by report
+    assert cache.invalidate("top-products", "2025-06-15") == 2
+    assert list(cache.response_cache) == [
+        ("monthly-sales", "2025-06-01", "2025-07-01", "", ""), ("top-products", "2025-01-01", "2025-02-01", "", 5)
+    ]
+    assert list(cache.month_cache) == [(date(2025, 6, 1), "", "")]
+    # range only, open-ended
+    assert cache.invalidate(end="2025-03-01") == 1
+    assert cache.invalidate() == 2
+    assert not cache.month_cache and not cache.response_cache
+
+def write_entries(path, worker):
+    from app import shared_cache
+    shared_cache.CACHE_SHARED_PATH = path
+    for i in range(50):
+        shared_cache.put(("q", worker, i), 1, [worker, i], compress_min_bytes=0, max_age=60)
+    shared_cache.flush()
+
+def use_shared_store(monkeypatch, path):
+    from app import shared_cache
+    monkeypatch.setattr(shared_cache, "CACHE_SHARED_PATH", str(path))
+    monkeypatch.setattr(shared_cache, "enabled", True)
+    monkeypatch.setattr(shared_cache, "_local", shared_cache.threading.local())
+    return shared_cache
+
+def test_shared_backend_serves_other_workers(monkeypatch, tmp_path):
+    import multiprocessing
+    from app import data_version
+    shared_cache = use_shared_store(monkeypatch, tmp_path / "private" / "shared.sqlite3")
+    monkeypatch.setattr(data_version, "current", 7)
+    monkeypatch.setattr(cache, "report_cache", {})
+    monkeypatch.setattr(cache, "cache_stats", dict.fromkeys(cache.cache_stats, 0))
+    calls = 0
+
+    @cache.cached_report
+    async def query(*, sql, params):
+        nonlocal calls
+        calls += 1
+        return [{"rows": "x" * 100000}]
+
+    params = {"start": "2025-06-01", "end": "2025-07-01"}
+    result = asyncio.run(query(sql="q", params=params))
+    shared_cache.flush()
+    # another worker: empty local cache, same store
+    cache.report_cache.clear()
+    assert asyncio.run(query(sql="q", params=params)) == result
+    assert calls == 1 and cache.cache_stats["shared_hits"] == 1
+    assert cache.report_key("q", params) in cache.report_cache
+
+    # entries written under an older data version are not read back
+    cache.report_cache.clear()
+    monkeypatch.setattr(data_version, "current", 8)
+    asyncio.run(query(sql="q", params=params))
+    assert calls == 2
+    shared_cache.flush()
+
+    # the version 8 result replaced the version 7 row of the same key
+    assert asyncio.run(shared_cache.invalidate("2025-06-15", "2025-06-16")) == 1
+    assert asyncio.run(shared_cache.get(cache.report_key("q", params), 8)) is None
+
+    # concurrent writers in separate processes all land. uvicorn spawns its workers, a
+    # forked one must leave the connections it inherited from this process alone
+    for method, workers in (("spawn", range(4)), ("fork", range(4, 6))):
+        context = multiprocessing.get_context(method)
+        processes = [context.Process(target=write_entries, args=(shared_cache.CACHE_SHARED_PATH, w)) for w in workers]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        assert all(process.exitcode == 0 for process in processes)
+    stored = [asyncio.run(shared_cache.get(("q", w, i), 1)) for w in range(6) for i in range(50)]
+    assert all(entry is not None for entry in stored)
+    assert [value for value, _ in stored] == [[w, i] for w in range(6) for i in range(50)]
+
+def test_shared_store_is_private_and_never_unpickled(monkeypatch, tmp_path):
+    import os
+    import stat
+    from datetime import date
+    from decimal import Decimal
+    shared_cache = use_shared_store(monkeypatch, tmp_path / "private" / "shared.sqlite3")
+
+    rows = [{"bucket": date(2025, 6, 1), "total": Decimal("1.50"), "ci": [1, 2], "$date": "kept"}]
+    assert shared_cache.decode(shared_cache.encode(rows)) == rows
+    shared_cache.put("k", 1, rows, compress_min_bytes=0, max_age=60)
+    shared_cache.flush()
+    assert asyncio.run(shared_cache.get("k", 1))[0] == rows
+    assert stat.S_IMODE(os.stat(tmp_path / "private").st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(shared_cache.CACHE_SHARED_PATH).st_mode) == 0o600
+
+    # a directory other users can write to is refused, and the tier switches off
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    use_shared_store(monkeypatch, shared / "store.sqlite3")
+    assert asyncio.run(shared_cache.get("k", 1)) is None
+    assert shared_cache.enabled is False
+    assert not (shared / "store.sqlite3").exists()
+
+    # so is a symlink planted in place of the file
+    (tmp_path / "private" / "link.sqlite3").symlink_to(tmp_path / "elsewhere.sqlite3")
+    use_shared_store(monkeypatch, tmp_path / "private" / "link.sqlite3")
+    assert asyncio.run(shared_cache.get("k", 1)) is None
+    assert shared_cache.enabled is False
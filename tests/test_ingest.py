@@ -0,0 +1,78 @@
+import json
+from datetime import date
+from psycopg import connect
+from psycopg.rows import dict_row
+from scripts import ingest_data
+
+def write_delta(path, rows):
+    with open(path, "w") as f:
+        f.write("sale_date,product_id,region_id,quantity,unit_price\n")
+        f.writelines(",".join(map(str, row)) + "\n" for row in rows)
+    return str(path)
+
+def test_append_is_idempotent_and_targets_months(clean_db, tmp_path):
+    with connect(clean_db, row_factory=dict_row, autocommit=True) as conn, \
+         connect(clean_db, autocommit=True) as listener:
+        conn.execute("INSERT INTO products (sku, name) VALUES ('A', 'A')")
+        conn.execute("INSERT INTO regions (code, name) VALUES ('US', 'US')")
+        conn.execute("SELECT create_month_partition('2025-05-01'::date)")
+        conn.execute("INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price) VALUES ('2025-05-20', 1, 1, 1, 10)")
+        conn.execute("SELECT refresh_sales_monthly_agg()")
+        listener.execute("LISTEN sales_ingested")
+
+        delta = write_delta(tmp_path / "delta.csv", [
+            ("2025-05-20", 1, 1, 1, 10),  # already loaded
+            ("2025-06-03", 1, 1, 2, 10),
+            ("2025-06-03", 1, 1, 2, 10),  # a second identical sale is kept
+            ("2025-07-01", 1, 1, 5, 20),
+            ("2025-07-02", 99, 1, 5, 20),  # unknown product
+        ])
+        changed = ingest_data.append_sales(conn, delta)
+        assert changed == {date(2025, 6, 1): 2, date(2025, 7, 1): 1}
+
+        notify = next(listener.notifies(timeout=1, stop_after=1))
+        payload = json.loads(notify.payload)
+        assert payload["months"] == ["2025-06-01", "2025-07-01"]
+        log = conn.execute("SELECT version, mode, months, rows_inserted FROM ingest_log").fetchall()
+        assert log == [{"version": payload["version"], "mode": "append",
+                        "months": [date(2025, 6, 1), date(2025, 7, 1)], "rows_inserted": 3}]
+
+        rollup = conn.execute("SELECT month, total_quantity FROM sales_monthly_agg ORDER BY month").fetchall()
+        assert [(r["month"], r["total_quantity"]) for r in rollup] == [
+            (date(2025, 5, 1), 1), (date(2025, 6, 1), 4), (date(2025, 7, 1), 5)
+        ]
+
+        # replaying the delta changes nothing and sends no notification
+        assert ingest_data.append_sales(conn, delta) == {}
+        assert list(listener.notifies(timeout=0.2, stop_after=1)) == []
+        assert conn.execute("SELECT COUNT(*) AS cnt FROM sales").fetchone()["cnt"] == 4
+
+        # a third copy of the June row is new
+        more = write_delta(tmp_path / "more.csv", [("2025-06-03", 1, 1, 2, 10)] * 3)
+        assert ingest_data.append_sales(conn, more) == {date(2025, 6, 1): 1}
+
+def test_snapshots_load_before_first_ingest():
+    # `docker compose up` starts the API before any migration has run
+    import asyncio
+    from psycopg_pool import AsyncConnectionPool
+    from app import data_version, dimensions
+    from tests.conftest import BASE_DB_URL, TEST_DB_URL
+
+    empty_url = TEST_DB_URL.rsplit("/", 1)[0] + "/test_clue_empty"
+    with connect(BASE_DB_URL, autocommit=True) as conn:
+        conn.execute("DROP DATABASE IF EXISTS test_clue_empty")
+        conn.execute("CREATE DATABASE test_clue_empty")
+
+    async def reload():
+        async with AsyncConnectionPool(empty_url, min_size=1, max_size=1) as pool:
+            return await dimensions.reload(pool), await data_version.reload(pool)
+
+    saved = dimensions.current, data_version.current
+    try:
+        dims, version = asyncio.run(reload())
+        assert dims.products == {} and dims.regions == {}
+        assert version is None
+    finally:
+        dimensions.current, data_version.current = saved
+        with connect(BASE_DB_URL, autocommit=True) as conn:
+            conn.execute("DROP DATABASE IF EXISTS test_clue_empty")
@@ -1,3 +1,7 @@
+import csv
+import json
+import time
+from datetime import date
 from psycopg import connect
 from app.sql import reports
 
@@ -31,8 +35,506 @@ def test_monthly_report(clean_db):
     with connect(clean_db) as conn:
         seed_small(conn)
         with conn.cursor() as cursor:
-            cursor.execute(reports.MONTHLY_SALES, {"start":"2025-06-01","end":"2025-07-01","sku":"","region":""})
+            cursor.execute(reports.monthly_sales_sql(), {"start":"2025-06-01","end":"2025-07-01","sku":"","region":""})
             rows = cursor.fetchall()
             assert rows[0][0] == "2025-06"
             # total revenue: 15 days * 2 qty * 10.00 = 300.00
             assert float(rows[0][1]) == 300.0
+
+def test_monthly_rollup_matches_raw(clean_db):
+    with connect(clean_db) as conn:
+        seed_small(conn)
+        conn.execute("SELECT refresh_sales_monthly_agg()")
+        with conn.cursor() as cursor:
+            params = {"start":"2025-06-01","end":"2025-07-01","sku":"","region":"","limit":5}
+            cursor.execute(reports.monthly_sales_sql(), params)
+            raw = cursor.fetchall()
+            cursor.execute(reports.monthly_sales_sql(rollup=True), params)
+            assert cursor.fetchall() == raw
+
+            cursor.execute(reports.top_products_sql(), params)
+            raw = cursor.fetchall()
+            cursor.execute(reports.top_products_sql(rollup=True), params)
+            assert cursor.fetchall() == raw
+            assert raw[0][0] == 1
+
+def test_report_endpoints(client, db_connection, reload_dimensions):
+    seed_small(db_connection)
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    reload_dimensions()
+
+    # month-aligned range is served from the rollup, the other one from raw sales
+    for end_date in ["2025-07-01", "2025-06-30"]:
+        resp = client.get("/reports/monthly-sales", params={"start_date": "2025-06-01", "end_date": end_date})
+        assert resp.status_code == 200
+        assert resp.json() == {"rows": [{"month": "2025-06", "total_revenue": 300, "total_quantity": 30}]}
+
+    resp = client.get("/reports/top-products", params={"start_date": "2025-06-01", "end_date": "2025-07-01", "region_code": "US"})
+    assert resp.status_code == 200
+    assert resp.json()["rows"] == [{"product_sku": "A", "product_name": "A", "total_revenue": 300, "total_quantity": 30}]
+
+def test_monthly_sales_composed_from_month_cells(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main
+    seed_small(db_connection)
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    reload_dimensions()
+
+    queried = []
+    run_query = main.run_query
+    async def recording_run_query(sql, params=None):
+        queried.append((params["start"], params["end"]))
+        return await run_query(sql, params)
+    monkeypatch.setattr(main, "run_query", recording_run_query)
+
+    def get(start, end):
+        resp = client.get("/reports/monthly-sales", params={"start_date": start, "end_date": end})
+        assert resp.status_code == 200
+        return resp.json()["rows"]
+
+    assert [r["month"] for r in get("2025-05-01", "2025-07-01")] == ["2025-06"]
+    # overlapping window only queries the months it has not seen yet
+    assert [r["month"] for r in get("2025-06-01", "2025-08-01")] == ["2025-06"]
+    assert [(str(s), str(e)) for s, e in queried] == [("2025-05-01", "2025-07-01"), ("2025-07-01", "2025-08-01")]
+
+    # closed months stay cached until ingest says otherwise
+    db_connection.execute("UPDATE sales SET quantity = quantity * 2")
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    assert get("2025-06-01", "2025-07-01")[0]["total_quantity"] == 30
+
+    db_connection.execute("NOTIFY sales_ingested")
+    for _ in range(50):
+        rows = get("2025-06-01", "2025-07-01")
+        if rows[0]["total_quantity"] == 60:
+            break
+        time.sleep(0.05)
+    assert rows[0]["total_quantity"] == 60
+
+def test_month_cells_read_across_an_ingest_are_not_kept(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main, cache, data_version
+    seed_small(db_connection)
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    reload_dimensions()
+    monkeypatch.setattr(data_version, "current", 1)
+
+    run_query = main.run_query
+    async def ingest_during_query(sql, params=None):
+        rows = await run_query(sql, params)
+        # An append ingest for June lands while the rollup query is in flight
+        cache.invalidate_months(["2025-06-01"])
+        data_version.current = 2
+        return rows
+    monkeypatch.setattr(main, "run_query", ingest_during_query)
+
+    resp = client.get("/reports/monthly-sales", params={"start_date": "2025-06-01", "end_date": "2025-07-01"})
+    assert resp.json()["rows"] == [{"month": "2025-06", "total_revenue": 300, "total_quantity": 30}]
+    # The rows are served, but the closed month is not cached forever from before the ingest
+    assert (date(2025, 6, 1), "", "") not in cache.month_cache
+
+def test_export_sales_streams_in_batches(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main
+    seed_small(db_connection)
+    reload_dimensions()
+    monkeypatch.setattr(main, "EXPORT_BATCH_SIZE", 4)
+    params = {"start_date": "2025-06-01", "end_date": "2025-06-11"}
+
+    resp = client.get("/exports/sales", params=params)
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 10
+    assert lines[0] == {"id": 1, "sale_date": "2025-06-01", "product_sku": "A", "region_code": "US", "quantity": 2, "unit_price": 10}
+
+    resp = client.get("/exports/sales", params={**params, "format": "csv", "region_code": "US"})
+    rows = list(csv.reader(resp.text.splitlines()))
+    assert rows[0] == ["id", "sale_date", "product_sku", "region_code", "quantity", "unit_price"]
+    assert len(rows) == 11
+
+    resp = client.get("/exports/sales", params={**params, "product_sku": "B"})
+    assert resp.text == ""
+
+    # Ranges over several months are read one partition at a time, still in date order
+    db_connection.execute("SELECT create_month_partition('2025-05-01'::date)")
+    db_connection.execute("SELECT create_month_partition('2025-07-01'::date)")
+    db_connection.execute("""
+      INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
+      VALUES ('2025-07-02', 1, 1, 1, 10), ('2025-05-30', 1, 1, 1, 10)
+    """)
+    resp = client.get("/exports/sales", params={"start_date": "2025-05-15", "end_date": "2025-07-10", "format": "csv"})
+    rows = list(csv.reader(resp.text.splitlines()))
+    assert rows[0][0] == "id" and len(rows) == 18
+    dates = [row[1] for row in rows[1:]]
+    assert dates == sorted(dates) and dates[0] == "2025-05-30" and dates[-1] == "2025-07-02"
+
+def test_batch_reports(client, db_connection, reload_dimensions):
+    from app.cache import clear_cache
+    seed_small(db_connection)
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    reload_dimensions()
+    monthly = {"report": "monthly-sales", "start_date": "2025-06-01", "end_date": "2025-07-01"}
+    specs = [
+        monthly,
+        {**monthly, "end_date": "2025-06-30", "region_code": "US"},
+        {**monthly, "product_sku": "B"},
+        {"report": "top-products", "start_date": "2025-06-01", "end_date": "2025-07-01", "limit": 1},
+        {"report": "top-products", "start_date": "2025-06-01", "end_date": "2025-06-10"},
+        monthly,
+    ]
+
+    resp = client.post("/reports/batch", json={"reports": specs})
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    # every spec matches what its single-report endpoint returns on a cold cache
+    clear_cache()
+    for spec, result in zip(specs, results):
+        spec = dict(spec)
+        path = "/reports/" + spec.pop("report")
+        assert client.get(path, params=spec).json() == result
+    assert results[0]["rows"][0]["total_revenue"] == 300
+    assert results[2] == {"rows": []}
+    assert results[4]["rows"][0]["total_quantity"] == 18
+
+    assert client.post("/reports/batch", json={"reports": []}).status_code == 422
+
+def test_unknown_codes_skip_the_database(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main
+    seed_small(db_connection)
+    reload_dimensions()
+
+    async def no_database(sql, params=None):
+        raise AssertionError("unknown codes should not query")
+    monkeypatch.setattr(main, "run_query", no_database)
+
+    params = {"start_date": "2025-06-01", "end_date": "2025-06-20"}
+    assert client.get("/reports/monthly-sales", params={**params, "product_sku": "NOPE"}).json() == {"rows": []}
+    assert client.get("/reports/monthly-sales", params={**params, "region_code": "XX"}).json() == {"rows": []}
+    assert client.get("/reports/top-products", params={**params, "region_code": "XX"}).json() == {"rows": []}
+    assert client.get("/exports/sales", params={**params, "region_code": "XX"}).text == ""
+
+def test_cached_responses_skip_rebuilding(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main
+    seed_small(db_connection)
+    reload_dimensions()
+    params = {"start_date": "2025-06-01", "end_date": "2025-06-20", "region_code": "US"}
+
+    first = client.get("/reports/top-products", params=params)
+    async def no_database(sql, params=None):
+        raise AssertionError("cached response should not query")
+    monkeypatch.setattr(main, "run_query", no_database)
+
+    second = client.get("/reports/top-products", params=params)
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["content-type"] == "application/json"
+
+    # the documented schema is unchanged
+    schema = client.get("/openapi.json").json()
+    ok = schema["paths"]["/reports/top-products"]["get"]["responses"]["200"]
+    assert ok["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/TopProductsResponse"}
+
+def test_server_timing_and_metrics(client, db_connection, reload_dimensions):
+    seed_small(db_connection)
+    reload_dimensions()
+    params = {"start_date": "2025-06-01", "end_date": "2025-06-20", "region_code": "US"}
+
+    miss = client.get("/reports/top-products", params=params)
+    phases = {part.split(";")[0]: part for part in miss.headers["server-timing"].split(", ")}
+    assert {"pool", "sql", "build", "serialize", "total"} <= set(phases)
+    assert phases["cache"] == "cache;desc=miss"
+
+    hit = client.get("/reports/top-products", params=params)
+    assert "cache;desc=hit" in hit.headers["server-timing"]
+    assert "sql;" not in hit.headers["server-timing"]
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{route="/reports/top-products",cache="hit"}' in body
+    assert 'report_phase_duration_seconds_bucket{route="/reports/top-products",phase="sql",le="+Inf"}' in body
+    assert "report_cache_hit_ratio " in body
+    assert "db_pool_pool_size " in body
+
+def test_etags_answer_revalidation_without_work(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main, data_version
+    from app.db import pool
+    seed_small(db_connection)
+    reload_dimensions()
+    db_connection.execute("SELECT bump_data_version()")
+    client.portal.call(data_version.reload, pool)
+    params = {"start_date": "2025-06-01", "end_date": "2025-07-01"}
+
+    first = client.get("/reports/monthly-sales", params=params)
+    etag = first.headers["etag"]
+    # June 2025 is closed, it can be cached for long
+    assert first.headers["cache-control"] == f"public, max-age={main.CLOSED_RANGE_MAX_AGE}"
+
+    def no_work(*args, **kwargs):
+        raise AssertionError("revalidation should not touch the cache or the database")
+    with monkeypatch.context() as m:
+        m.setattr(main, "get_response", no_work)
+        m.setattr(main, "run_query", no_work)
+        not_modified = client.get("/reports/monthly-sales", params=params, headers={"If-None-Match": f'W/{etag}'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    # other params get another tag, ranges into the future must revalidate
+    other = client.get("/reports/top-products", params={"start_date": "2025-06-01", "end_date": "2099-01-01"})
+    assert other.headers["etag"] != etag
+    assert other.headers["cache-control"] == "public, no-cache"
+
+    # an ingest bumps the version, old tags no longer match
+    db_connection.execute("SELECT bump_data_version()")
+    client.portal.call(data_version.reload, pool)
+    fresh = client.get("/reports/monthly-sales", params=params, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+    assert fresh.json() == first.json()
+
+def test_warmup_fills_caches_and_gates_readiness(client, db_connection, reload_dimensions, monkeypatch, tmp_path):
+    from app import main, warmup
+    seed_small(db_connection)
+    reload_dimensions()
+    listed = {"report": "top-products", "start_date": "2025-06-01", "end_date": "2025-06-20", "region_code": "US"}
+    (tmp_path / "warm.json").write_text(json.dumps([listed]))
+    monkeypatch.setattr(warmup, "WARMUP_REPORTS_FILE", str(tmp_path / "warm.json"))
+    monkeypatch.setattr(warmup, "WARMUP_LEARNED", 5)
+    monkeypatch.setattr(warmup, "requested", warmup.Counter())
+    monkeypatch.setitem(warmup.state, "ready", False)
+
+    learned = {"start_date": "2025-06-03", "end_date": "2025-06-10"}
+    assert client.get("/reports/monthly-sales", params=learned).status_code == 200
+    from app.cache import clear_cache
+    clear_cache()
+
+    assert client.get("/health", params={"ready": True}).status_code == 503
+    client.portal.call(main.warm_caches)
+    health = client.get("/health", params={"ready": True})
+    assert health.status_code == 200
+    assert health.json()["warmup"]["failed"] == 0
+
+    async def no_database(sql, params=None):
+        raise AssertionError("warmed report should not query")
+    monkeypatch.setattr(main, "run_query", no_database)
+    top = client.get("/reports/top-products", params={k: v for k, v in listed.items() if k != "report"})
+    assert [r["product_sku"] for r in top.json()["rows"]] == ["A"]
+    assert client.get("/reports/monthly-sales", params=learned).json()["rows"][0]["total_quantity"] == 14
+
+def test_bad_warmup_files_still_mark_ready(client, db_connection, reload_dimensions, monkeypatch, tmp_path):
+    from app import main, warmup
+    seed_small(db_connection)
+    reload_dimensions()
+    listed = {"report": "top-products", "start_date": "2025-06-01", "end_date": "2025-06-20"}
+    (tmp_path / "warm.json").write_text(json.dumps([listed, {"report": "nope"}, "junk"]))
+    (tmp_path / "state.json").write_text("{not json")
+    monkeypatch.setattr(warmup, "WARMUP_REPORTS_FILE", str(tmp_path / "warm.json"))
+    monkeypatch.setattr(warmup, "WARMUP_STATE_FILE", str(tmp_path / "state.json"))
+    monkeypatch.setattr(warmup, "WARMUP_LEARNED", 5)
+    monkeypatch.setattr(warmup, "requested", warmup.Counter({("top-products", "x"): 3}))
+    monkeypatch.setitem(warmup.state, "ready", False)
+
+    warmup.load_learned()
+    specs = warmup.warm_specs(["US", "EU"])
+    assert len(specs) == len(warmup.default_specs(["US", "EU"])) + 1
+
+    (tmp_path / "warm.json").write_text("[")
+    client.portal.call(main.warm_caches)
+    assert client.get("/health", params={"ready": True}).status_code == 200
+
+def test_timeseries_breakdowns_from_one_scan(client, db_connection, reload_dimensions, monkeypatch):
+    seed_small(db_connection)
+    db_connection.execute("SELECT create_month_partition('2025-07-01'::date)")
+    db_connection.execute("""
+      INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
+      SELECT '2025-07-10', p.id, r.id, 1, 5.00
+      FROM products p CROSS JOIN regions r WHERE p.sku = 'B' AND r.code = 'EU';
+    """)
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    reload_dimensions()
+
+    params = {"start_date": "2025-06-01", "end_date": "2025-08-01", "group_by": "region"}
+    resp = client.get("/reports/timeseries", params=params)
+    assert resp.status_code == 200
+    assert resp.json() == {"granularity": "month", "group_by": "region", "columns": {
+        "bucket": ["2025-06-01", "2025-06-01", "2025-07-01", "2025-07-01"],
+        "region_code": [None, "US", None, "EU"],
+        "total_revenue": [300, 300, 5, 5],
+        "total_quantity": [30, 30, 1, 1],
+    }}
+    # the rollup table and raw sales agree
+    raw = client.get("/reports/timeseries", params={**params, "end_date": "2025-07-31"}).json()
+    assert raw["columns"] == resp.json()["columns"]
+
+    # CUBE gives the total, per-product, per-region and per-pair series in one pass
+    cols = client.get("/reports/timeseries", params={
+        "start_date": "2025-06-01", "end_date": "2025-08-01", "granularity": "quarter", "group_by": "both"
+    }).json()["columns"]
+    series = {
+        (b, r, p): q for b, r, p, q in zip(cols["bucket"], cols["region_code"], cols["product_sku"], cols["total_quantity"])
+    }
+    assert series == {
+        ("2025-04-01", None, None): 30, ("2025-04-01", None, "A"): 30,
+        ("2025-04-01", "US", None): 30, ("2025-04-01", "US", "A"): 30,
+        ("2025-07-01", None, None): 1, ("2025-07-01", None, "B"): 1,
+        ("2025-07-01", "EU", None): 1, ("2025-07-01", "EU", "B"): 1,
+    }
+
+    # weeks start on Monday, 2025-06-01 was a Sunday
+    cols = client.get("/reports/timeseries", params={
+        "start_date": "2025-06-01", "end_date": "2025-06-16", "granularity": "week", "product_sku": "A"
+    }).json()["columns"]
+    assert cols == {
+        "bucket": ["2025-05-26", "2025-06-02", "2025-06-09"],
+        "total_revenue": [20, 140, 140],
+        "total_quantity": [2, 14, 14],
+    }
+    params = {"start_date": "2025-06-01", "end_date": "2025-06-16", "region_code": "XX"}
+    assert client.get("/reports/timeseries", params=params).json()["columns"]["bucket"] == []
+
+    # row counts are bounded before anything runs: seed_small has 2 products and 2 regions
+    from app import main
+    ids = {"product_id": None, "region_id": None}
+    assert main.timeseries_rows("2025-06-01", "2025-06-16", "week", "none", ids) == 3
+    assert main.timeseries_rows("2025-01-15", "2025-07-01", "quarter", "both", ids) == 2 * 9
+    assert main.timeseries_rows("2025-06-01", "2025-06-16", "day", "both", {**ids, "region_id": 1}) == 15 * 2 * 3
+    monkeypatch.setattr(main, "TIMESERIES_MAX_ROWS", 100)
+    resp = client.get("/reports/timeseries", params={
+        "start_date": "2025-06-01", "end_date": "2025-07-01", "granularity": "day", "group_by": "both"
+    })
+    assert resp.status_code == 422 and "270 rows" in resp.json()["detail"]
+
+def test_long_ranges_fan_out_per_month(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main
+    seed_small(db_connection)
+    for month in ("2025-07-01", "2025-08-01"):
+        db_connection.execute("SELECT create_month_partition(%s::date)", (month,))
+    db_connection.execute("""
+      INSERT INTO sales (sale_date, product_id, region_id, quantity, unit_price)
+      SELECT d::date, 1 + i % 2, 1 + i % 2, 1 + i, 7
+      FROM generate_series('2025-07-01','2025-08-31', interval '1 day') d, generate_series(0, 2) i;
+    """)
+    db_connection.execute("SELECT refresh_sales_monthly_agg()")
+    reload_dimensions()
+    params = {"start_date": "2025-06-10", "end_date": "2025-08-20"}
+
+    running = peak = 0
+    real_run_query = main.run_query
+    async def counting_run_query(sql, params=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await main.asyncio.sleep(0.01)
+            return await real_run_query(sql, params)
+        finally:
+            running -= 1
+    monkeypatch.setattr(main, "run_query", counting_run_query)
+
+    fanned = [client.get(path, params=params).json() for path in ("/reports/monthly-sales", "/reports/top-products")]
+    # the partial June and August pieces and the whole July are read at the same time
+    assert peak == 3
+    assert [row["month"] for row in fanned[0]["rows"]] == ["2025-06", "2025-07", "2025-08"]
+
+    # the worker cap holds
+    monkeypatch.setattr(main, "FANOUT_WORKERS", 1)
+    main.clear_cache()
+    peak = 0
+    assert client.get("/reports/top-products", params=params).json() == fanned[1]
+    assert peak == 1
+
+    # concurrent fanned-out requests share the worker-wide connection budget
+    monkeypatch.setattr(main, "FANOUT_WORKERS", 4)
+    monkeypatch.setattr(main, "_fanout_slots", main.asyncio.Semaphore(2))
+    peak = 0
+    async def two_requests():
+        queries = [("SELECT %(x)s AS x", {"x": i}) for i in range(4)]
+        return await main.asyncio.gather(main.fan_out(queries[:2]), main.fan_out(queries[2:]))
+    assert client.portal.call(two_requests) == [[[{"x": 0}], [{"x": 1}]], [[{"x": 2}], [{"x": 3}]]]
+    assert peak == 2
+
+    # so does the whole-month run of a fanned-out monthly-sales request
+    monkeypatch.setattr(main, "_fanout_slots", main.asyncio.Semaphore(1))
+    main.clear_cache()
+    peak = 0
+    assert client.get("/reports/monthly-sales", params=params).json() == fanned[0]
+    assert peak == 1
+
+    monkeypatch.setattr(main, "fanned_out", lambda start_date, end_date: None)
+    main.clear_cache()
+    single = [client.get(path, params=params).json() for path in ("/reports/monthly-sales", "/reports/top-products")]
+    assert fanned == single
+
+def test_admission_control_and_timeouts(client, db_connection, reload_dimensions, monkeypatch):
+    import asyncio
+    from psycopg_pool import PoolTimeout
+    from app import admission, main
+    seed_small(db_connection)
+    reload_dimensions()
+    params = {"start_date": "2025-06-01", "end_date": "2025-06-20"}
+    cached = client.get("/reports/top-products", params=params)
+
+    # every slot taken: cached responses are still served, the rest is shed after a short wait
+    monkeypatch.setattr(admission, "ADMISSION_WAIT_SECONDS", 0.05)
+    monkeypatch.setitem(admission._semaphores, "top_products", asyncio.Semaphore(0))
+    before = dict(admission.stats["top_products"])
+    assert client.get("/reports/top-products", params=params).content == cached.content
+    resp = client.get("/reports/top-products", params={**params, "limit": 3})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(admission.RETRY_AFTER_SECONDS)
+    counts = admission.stats["top_products"]
+    assert counts["queued"] == before.get("queued", 0) + 1
+    assert counts["rejected"] == before.get("rejected", 0) + 1
+
+    # pooled sessions carry the statement timeout, queries past it are cancelled
+    async def show_timeout():
+        async with main.get_conn() as conn:
+            return (await (await conn.execute("SHOW statement_timeout")).fetchone())[0]
+    assert client.portal.call(show_timeout) == "30s"
+
+    async def slow_query(sql, params=None):
+        async with main.get_conn() as conn:
+            async with conn.transaction():
+                await conn.execute("SET LOCAL statement_timeout = 50")
+                await conn.execute("SELECT pg_sleep(1)")
+    monkeypatch.setattr(main, "run_query", slow_query)
+    assert client.get("/reports/monthly-sales", params=params).status_code == 504
+
+    async def no_connection(sql, params=None):
+        raise PoolTimeout("couldn't get a connection after 5.00 sec")
+    monkeypatch.setattr(main, "run_query", no_connection)
+    assert client.get("/reports/monthly-sales", params={**params, "region_code": "US"}).status_code == 503
+
+    metrics = client.get("/metrics").text
+    assert 'admission_requests_total{endpoint="monthly_sales",outcome="statement_timeouts"} 1' in metrics
+    assert 'admission_requests_total{endpoint="monthly_sales",outcome="pool_timeouts"} 1' in metrics
+    assert 'admission_in_flight{endpoint="monthly_sales"} 0' in metrics
+
+def test_cache_admin_endpoints(client, db_connection, reload_dimensions, monkeypatch):
+    from app import main
+    seed_small(db_connection)
+    reload_dimensions()
+    for end_date in ("2025-06-10", "2025-06-20"):
+        client.get("/reports/top-products", params={"start_date": "2025-06-01", "end_date": end_date})
+
+    # without a configured token the admin endpoints are off
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert client.get("/admin/cache/keys").status_code == 403
+    assert client.delete("/admin/cache").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    admin = {"X-Admin-Token": "secret"}
+
+    stats = client.get("/cache/stats").json()
+    assert stats["bytes"]["response"] > 0 and stats["max_bytes"]["response"] > stats["bytes"]["response"]
+    keys = client.get("/admin/cache/keys", params={"limit": 50}, headers=admin).json()["keys"]
+    assert {"cache": "response", "key": ["top-products", "2025-06-01", "2025-06-20", "", 5]} in [
+        {"cache": k["cache"], "key": k["key"]} for k in keys
+    ]
+    assert all(k["bytes"] > 0 for k in keys)
+    assert [k["bytes"] for k in keys] == sorted((k["bytes"] for k in keys), reverse=True)
+
+    resp = client.delete("/admin/cache", params={"report": "top-products", "start_date": "2025-06-15"}, headers=admin)
+    assert resp.json()["dropped"] >= 1
+    remaining = [k["key"] for k in client.get("/admin/cache/keys", headers=admin).json()["keys"] if k["cache"] == "response"]
+    assert remaining == [["top-products", "2025-06-01", "2025-06-10", "", 5]]
+    assert client.delete("/admin/cache", params={"start_date": "June"}, headers=admin).status_code == 422
+
+    assert client.delete("/admin/cache").status_code == 403
+    assert client.delete("/admin/cache", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.delete("/admin/cache", headers=admin).status_code == 200
+    assert client.get("/cache/stats").json()["responses"] == 0